@@ -0,0 +1,70 @@
+"""Who may reach which view
+
+Rules are declared per view module and, where a view differs from the
+rest of its module, per URL name. AccountCheckMiddleWare compiles them
+into one table keyed by (view function, role) on its first request, so
+checking a request is a single dict lookup.
+"""
+from django.urls import get_resolver, reverse
+from django.urls.resolvers import URLResolver
+
+ANONYMOUS = None
+ADMIN = '1'  # CustomUser.user_type
+VOTER = '2'
+EVERYONE = frozenset([ANONYMOUS, ADMIN, VOTER])
+USERS = frozenset([ADMIN, VOTER])
+
+MODULE_ACCESS = {
+    'administrator.views': frozenset([ADMIN]),
+    'voting.views': frozenset([VOTER]),
+    'django.contrib.auth.views': EVERYONE,
+}
+
+URL_ACCESS = {
+    'account_login': EVERYONE,
+    'account_register': EVERYONE,
+    'fetch_ballot': USERS,  # The admin's ballot preview loads it too
+}
+
+DEFAULT_ACCESS = USERS  # Logout, Django admin, anything else
+
+NO_ACCESS = "You do not have access to this resource"
+LOGIN_REQUIRED = "You need to be logged in to perform this operation"
+
+
+def role_of(user):
+    return user.user_type if user.is_authenticated else ANONYMOUS
+
+
+def denial(module, url_name, role):
+    """None when role may reach the view, else (error message or None,
+    where to redirect)
+    """
+    allowed = URL_ACCESS.get(url_name) or MODULE_ACCESS.get(module, DEFAULT_ACCESS)
+    if role in allowed:
+        return None
+    if role == ADMIN:
+        return NO_ACCESS, reverse('adminDashboard')
+    if role == VOTER:
+        return NO_ACCESS, reverse('voterDashboard')
+    if role == ANONYMOUS and module in ('administrator.views', 'voting.views'):
+        return LOGIN_REQUIRED, reverse('account_login')
+    # Unknown user types never get in
+    return None, reverse('account_login')
+
+
+def _views(resolver):
+    for pattern in resolver.url_patterns:
+        if isinstance(pattern, URLResolver):
+            yield from _views(pattern)
+        else:
+            yield pattern.callback, pattern.name
+
+
+def compile_policy():
+    """(view function, role) -> denial() for every view in the URLconf"""
+    table = {}
+    for view_func, url_name in _views(get_resolver()):
+        for each in EVERYONE:
+            table[(view_func, each)] = denial(view_func.__module__, url_name, each)
+    return table
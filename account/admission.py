@@ -0,0 +1,159 @@
+"""Admission control for the password hashing done at login
+
+Checking a password costs a CPU core for hundreds of milliseconds. Every
+login must hold one of LOGIN_HASH_SLOTS slots while it hashes; the slots
+are flock()ed files in LOGIN_ADMISSION_DIR, so the limit holds across all
+the workers of a node. A login finding no free slot takes one of
+LOGIN_QUEUE_LENGTH queue places and polls for a slot until
+LOGIN_QUEUE_TIMEOUT. With the queue full, or on timeout, LoginBusy is
+raised and the caller answers 503 with Retry-After, leaving the remaining
+cores to the ballot and submit paths.
+"""
+import fcntl
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from django.conf import settings
+
+POLL_INTERVAL = 0.02
+
+
+class LoginBusy(Exception):
+    def __init__(self, retry_after):
+        super().__init__("Too many logins in progress")
+        self.retry_after = retry_after
+
+
+class Metrics:
+    """Counters and recent hash latencies of this worker process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.latencies = deque(maxlen=500)
+
+    def count(self, name):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def record(self, seconds):
+        with self.lock:
+            self.admitted += 1
+            self.latencies.append(seconds)
+
+    def mean_latency(self):
+        with self.lock:
+            if not self.latencies:
+                return None
+            return sum(self.latencies) / len(self.latencies)
+
+    def snapshot(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            snapshot = {
+                'admitted': self.admitted,
+                'queued': self.queued,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+            }
+        if latencies:
+            snapshot['hash_ms'] = {
+                'p50': round(latencies[len(latencies) // 2] * 1000, 1),
+                'p95': round(latencies[int(len(latencies) * 0.95)] * 1000, 1),
+                'max': round(latencies[-1] * 1000, 1),
+            }
+        return snapshot
+
+
+metrics = Metrics()
+
+
+def _slot_path(kind, index):
+    return os.path.join(settings.LOGIN_ADMISSION_DIR, '%s.%d' % (kind, index))
+
+
+def _try_slot(kind, count):
+    """An fd holding a free slot of this kind, or None if all are taken.
+    Every attempt opens its own file description, so threads of one process
+    exclude each other as well.
+    """
+    os.makedirs(settings.LOGIN_ADMISSION_DIR, exist_ok=True)
+    for index in range(count):
+        fd = os.open(_slot_path(kind, index), os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            continue
+        return fd
+    return None
+
+
+def _busy(kind, count):
+    """How many slots of this kind are held on the node right now"""
+    busy = 0
+    for index in range(count):
+        try:
+            fd = os.open(_slot_path(kind, index), os.O_RDONLY)
+        except FileNotFoundError:
+            continue
+        try:
+            fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+        except BlockingIOError:
+            busy += 1
+        finally:
+            os.close(fd)  # Also drops the probe's shared lock
+    return busy
+
+
+def retry_after():
+    """Seconds until the queue is likely to have drained"""
+    mean = metrics.mean_latency() or 1
+    waves = (settings.LOGIN_QUEUE_LENGTH + settings.LOGIN_HASH_SLOTS) / settings.LOGIN_HASH_SLOTS
+    return max(1, math.ceil(mean * waves))
+
+
+@contextmanager
+def hashing_slot():
+    """Hold a node-wide hashing slot for the body, or raise LoginBusy"""
+    fd = _try_slot('hash', settings.LOGIN_HASH_SLOTS)
+    if fd is None:
+        place = _try_slot('queue', settings.LOGIN_QUEUE_LENGTH)
+        if place is None:
+            metrics.count('rejected')
+            raise LoginBusy(retry_after())
+        metrics.count('queued')
+        try:
+            deadline = time.monotonic() + settings.LOGIN_QUEUE_TIMEOUT
+            while fd is None and time.monotonic() < deadline:
+                time.sleep(POLL_INTERVAL)
+                fd = _try_slot('hash', settings.LOGIN_HASH_SLOTS)
+        finally:
+            os.close(place)
+        if fd is None:
+            metrics.count('timed_out')
+            raise LoginBusy(retry_after())
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        metrics.record(time.monotonic() - started)
+        os.close(fd)
+
+
+def node_status():
+    """Slots in use and queue depth on this node, with this worker's metrics"""
+    return {
+        'hashing': _busy('hash', settings.LOGIN_HASH_SLOTS),
+        'hash_slots': settings.LOGIN_HASH_SLOTS,
+        'queue_depth': _busy('queue', settings.LOGIN_QUEUE_LENGTH),
+        'queue_length': settings.LOGIN_QUEUE_LENGTH,
+        'worker': metrics.snapshot(),
+    }
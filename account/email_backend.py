@@ -1,6 +1,8 @@
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
 
+from .admission import hashing_slot
+
 
 class EmailBackend(ModelBackend):
     def authenticate(self, username=None, password=None, **kwargs):
@@ -10,6 +12,20 @@ class EmailBackend(ModelBackend):
         except UserModel.DoesNotExist:
             return None
         else:
-            if user.check_password(password):
-                return user
+            # May raise LoginBusy when the node is saturated with logins.
+            # A correct password hashed at another cost or with another
+            # hasher than the policy (account/hashers.py) is rehashed and
+            # saved by check_password().
+            with hashing_slot():
+                if user.check_password(password):
+                    return user
         return None
+
+    def get_user(self, user_id):
+        # The voter row comes in the same query: every voter page reads it
+        UserModel = get_user_model()
+        try:
+            user = UserModel._default_manager.select_related('voter').get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
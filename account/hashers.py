@@ -0,0 +1,35 @@
+"""Password hashers whose cost comes from settings
+
+Set the cost with PASSWORD_PBKDF2_ITERATIONS / PASSWORD_SCRYPT_* (measure
+it with `manage.py calibrate_hashers`); the first entry of
+PASSWORD_HASHERS is the policy. Hashes made at any other cost, or with
+another hasher, still verify and are rehashed at the configured cost on
+the user's next successful login.
+"""
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, ScryptPasswordHasher
+
+
+class ConfiguredPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return settings.PASSWORD_PBKDF2_ITERATIONS
+
+
+class ConfiguredScryptPasswordHasher(ScryptPasswordHasher):
+    @property
+    def work_factor(self):
+        return settings.PASSWORD_SCRYPT_WORK_FACTOR
+
+    @property
+    def block_size(self):
+        return settings.PASSWORD_SCRYPT_BLOCK_SIZE
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_SCRYPT_PARALLELISM
+
+    @property
+    def maxmem(self):
+        # scrypt needs 128 * n * r bytes; OpenSSL's default cap is 32MB
+        return 2 * 128 * self.work_factor * self.block_size
@@ -0,0 +1,78 @@
+import time
+
+from django.contrib import messages
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.management.base import BaseCommand
+from django.shortcuts import redirect
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+
+from account.access import ADMIN, VOTER
+from account.middleware import AccountCheckMiddleWare
+from account.models import CustomUser
+
+
+def legacy_process_view(request, view_func):
+    """AccountCheckMiddleWare.process_view before the policy was compiled"""
+    modulename = view_func.__module__
+    user = request.user
+    if user.is_authenticated:
+        if user.user_type == '1':
+            if modulename == 'voting.views':
+                if request.path == reverse('fetch_ballot'):
+                    pass
+                else:
+                    messages.error(request, "You do not have access to this resource")
+                    return redirect(reverse('adminDashboard'))
+        elif user.user_type == '2':
+            if modulename == 'administrator.views':
+                messages.error(request, "You do not have access to this resource")
+                return redirect(reverse('voterDashboard'))
+        else:
+            return redirect(reverse('account_login'))
+    else:
+        if request.path == reverse('account_login') or request.path == reverse('account_register') or modulename == 'django.contrib.auth.views' or request.path == reverse('account_login'):
+            pass
+        elif modulename == 'administrator.views' or modulename == 'voting.views':
+            messages.error(request, "You need to be logged in to perform this operation")
+            return redirect(reverse('account_login'))
+        else:
+            return redirect(reverse('account_login'))
+
+
+class Command(BaseCommand):
+    help = "Time AccountCheckMiddleWare's per-request check, legacy against compiled"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20000)
+
+    def handle(self, *args, **options):
+        paths = [reverse(name) for name in (
+            'account_login', 'adminDashboard', 'adminViewVoters', 'viewVotes',
+            'voterDashboard', 'show_ballot', 'submit_ballot', 'fetch_ballot')]
+        users = [AnonymousUser(), CustomUser(user_type=ADMIN), CustomUser(user_type=VOTER)]
+        factory = RequestFactory()
+        cases = []
+        for path in paths:
+            match = resolve(path)
+            for user in users:
+                request = factory.get(path)
+                request.user = user
+                request.resolver_match = match
+                request._messages = CookieStorage(request)
+                cases.append((request, match.func))
+
+        # AccessPolicyTests checks both send every case to the same place
+        middleware = AccountCheckMiddleWare(lambda request: None)
+        rounds = max(1, options['requests'] // len(cases))
+        for label, check in (
+                ("legacy", lambda request, view_func: legacy_process_view(request, view_func)),
+                ("compiled", lambda request, view_func: middleware.process_view(request, view_func, (), {}))):
+            started = time.perf_counter()
+            for _ in range(rounds):
+                for request, view_func in cases:
+                    check(request, view_func)
+            elapsed = time.perf_counter() - started
+            self.stdout.write("%-8s %6.2fus per request" %
+                              (label, elapsed / (rounds * len(cases)) * 1e6))
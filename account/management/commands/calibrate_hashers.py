@@ -0,0 +1,73 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, ScryptPasswordHasher
+from django.core.management.base import BaseCommand
+
+# OWASP's 2023 floors; recommending less would trade away too much
+PBKDF2_MIN_ITERATIONS = 600000
+SCRYPT_MIN_WORK_FACTOR = 2 ** 14
+
+
+class Command(BaseCommand):
+    help = "Time the password hashers on this machine and recommend costs for a target login latency"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target-ms', type=float, default=250,
+                            help="Hashing time one login may cost (default 250ms)")
+        parser.add_argument('--samples', type=int, default=3,
+                            help="Timings per cost; the fastest is kept")
+
+    def best_of(self, samples, hash_once):
+        best = None
+        for _ in range(samples):
+            started = time.perf_counter()
+            hash_once()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def handle(self, *args, **options):
+        target = options['target_ms'] / 1000
+        samples = options['samples']
+        slots = settings.LOGIN_HASH_SLOTS
+        pbkdf2 = PBKDF2PasswordHasher()
+        salt = pbkdf2.salt()
+
+        self.stdout.write("PBKDF2-SHA256")
+        per_iteration = None
+        for iterations in (100000, 300000, 600000, 1000000):
+            elapsed = self.best_of(samples, lambda: pbkdf2.encode('calibrate', salt, iterations))
+            per_iteration = elapsed / iterations
+            self.stdout.write("  %8d iterations: %7.1fms, %5.1f logins/s over %d slot(s)" %
+                              (iterations, elapsed * 1000, slots / elapsed, slots))
+        # PBKDF2 is linear in its iterations; the largest run is the most precise
+        iterations = max(PBKDF2_MIN_ITERATIONS, int(target / per_iteration) // 10000 * 10000)
+
+        self.stdout.write("scrypt (r=8, p=1)")
+        scrypt = ScryptPasswordHasher()
+        work_factor = None
+        for exponent in range(14, 18):
+            n = 2 ** exponent
+            scrypt.maxmem = 2 * 128 * n * 8
+            elapsed = self.best_of(samples, lambda: scrypt.encode('calibrate', salt, n, 8, 1))
+            self.stdout.write("  n=2**%d (%3dMB): %7.1fms, %5.1f logins/s over %d slot(s)" %
+                              (exponent, 128 * n * 8 // 2 ** 20, elapsed * 1000,
+                               slots / elapsed, slots))
+            if elapsed <= target:
+                work_factor = n
+        work_factor = max(SCRYPT_MIN_WORK_FACTOR, work_factor or 0)
+
+        self.stdout.write("")
+        self.stdout.write(self.style.SUCCESS(
+            "For about %dms per login set in e_voting/settings.py:" % options['target_ms']))
+        self.stdout.write("  PASSWORD_PBKDF2_ITERATIONS = %d  (now %d, about %.0fms)" % (
+            iterations, settings.PASSWORD_PBKDF2_ITERATIONS, iterations * per_iteration * 1000))
+        self.stdout.write("or, with ConfiguredScryptPasswordHasher first in PASSWORD_HASHERS:")
+        self.stdout.write("  PASSWORD_SCRYPT_WORK_FACTOR = 2 ** %d" % (work_factor.bit_length() - 1))
+        if iterations * per_iteration > target:
+            self.stdout.write(self.style.WARNING(
+                "PBKDF2 cannot meet the target here without dropping below %d "
+                "iterations; consider more LOGIN_HASH_SLOTS or faster CPUs" %
+                PBKDF2_MIN_ITERATIONS))
+        self.stdout.write("Passwords are rehashed at the new cost on each user's next login.")
@@ -1,38 +1,54 @@
+import math
+
 from django.utils.deprecation import MiddlewareMixin
-from django.urls import reverse
 from django.shortcuts import redirect
 from django.contrib import messages
+from django.http import HttpResponse, JsonResponse
+
+from . import ratelimit
+from .access import compile_policy, denial, role_of
 
 
 class AccountCheckMiddleWare(MiddlewareMixin):
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.policy = None  # Compiled on the first request, once URLs can be loaded
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if self.policy is None:
+            self.policy = compile_policy()
+        key = (view_func, role_of(request.user))  # Who is the current user ?
+        try:
+            denied = self.policy[key]
+        except KeyError:
+            # A view outside the URLconf the policy was compiled from
+            denied = self.policy[key] = denial(
+                view_func.__module__, request.resolver_match.url_name, key[1])
+        if denied is not None:
+            message, url = denied
+            if message:
+                messages.error(request, message)
+            return redirect(url)
+
+
+class RateLimitMiddleware(MiddlewareMixin):
+    """Refuses floods of the views in RATE_LIMITS with 429, per client IP
+    and per account, before CSRF, authentication or the view run
+    """
+
     def process_view(self, request, view_func, view_args, view_kwargs):
-        modulename = view_func.__module__
-        user = request.user  # Who is the current user ?
-        if user.is_authenticated:
-            if user.user_type == '1':  # Admin
-                if modulename == 'voting.views':
-                    error = True
-                    if request.path == reverse('fetch_ballot'):
-                        pass
-                    else:
-                        messages.error(
-                            request, "You do not have access to this resource")
-                        return redirect(reverse('adminDashboard'))
-            elif user.user_type == '2':  # Voter
-                if modulename == 'administrator.views':
-                    messages.error(
-                        request, "You do not have access to this resource")
-                    return redirect(reverse('voterDashboard'))
-            else:  # None of the aforementioned ? Please take the user to login page
-                return redirect(reverse('account_login'))
+        buckets = ratelimit.buckets_for(request, request.resolver_match.url_name)
+        if not buckets:
+            return None
+        wait = ratelimit.take(buckets)
+        if not wait:
+            return None
+        retry_after = max(1, math.ceil(wait))
+        message = "Too many requests. Please try again in %d seconds" % retry_after
+        if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+            response = JsonResponse(
+                {'error': True, 'data': message, 'message': message}, status=429)
         else:
-            # If the path is login or has anything to do with authentication, pass
-            if request.path == reverse('account_login') or request.path == reverse('account_register') or modulename == 'django.contrib.auth.views' or request.path == reverse('account_login'):
-                pass
-            elif modulename == 'administrator.views' or modulename == 'voting.views':
-                # If visitor tries to access administrator or voters functions
-                messages.error(
-                    request, "You need to be logged in to perform this operation")
-                return redirect(reverse('account_login'))
-            else:
-                return redirect(reverse('account_login'))
+            response = HttpResponse(message, status=429, content_type='text/plain')
+        response['Retry-After'] = str(retry_after)
+        return response
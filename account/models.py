@@ -1,5 +1,6 @@
 from django.contrib.auth.models import AbstractUser, UserManager
 from django.db import models
+from django.db.models.functions import Lower
 from django.contrib.auth.hashers import make_password
 from django.db.models.signals import post_save
 from django.dispatch import receiver
@@ -43,5 +44,12 @@ class CustomUser(AbstractUser):
     REQUIRED_FIELDS = []
     objects = CustomUserManager()
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Case-insensitive name prefix search of the voter directory
+            models.Index(Lower('last_name'), name='customuser_last_name_lower'),
+            models.Index(Lower('first_name'), name='customuser_first_name_lower'),
+        ]
+
     def __str__(self):
         return self.last_name + " " + self.first_name
@@ -0,0 +1,106 @@
+"""Token buckets shared by every worker on the node
+
+Buckets live in a small SQLite file (RATE_LIMIT_PATH, WAL, synchronous
+off: losing them in a crash only forgives some clients). A bucket holds
+up to `requests` tokens and regains them at requests/seconds per second;
+each request takes one token from every bucket it is counted against,
+in one transaction, or is refused if any of them is empty.
+"""
+import random
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+
+PRUNE_CHANCE = 0.001  # Share of calls that also drop idle buckets
+
+_local = threading.local()
+
+
+def _connection():
+    path = str(settings.RATE_LIMIT_PATH)
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute("""CREATE TABLE IF NOT EXISTS buckets (
+            key TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated REAL NOT NULL) WITHOUT ROWID""")
+        connections[path] = conn
+    return conn
+
+
+def take(buckets):
+    """buckets: [(key, requests, seconds)]. Takes a token from each and
+    returns 0, or takes none and returns the seconds until all have one.
+    """
+    now = time.time()
+    conn = _connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        levels = []
+        wait = 0
+        for key, requests, seconds in buckets:
+            rate = requests / seconds
+            row = conn.execute(
+                "SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens = requests if row is None else \
+                min(requests, row[0] + (now - row[1]) * rate)
+            if tokens < 1:
+                wait = max(wait, (1 - tokens) / rate)
+            levels.append((key, tokens))
+        if not wait:
+            conn.executemany(
+                "INSERT INTO buckets (key, tokens, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, "
+                "updated = excluded.updated",
+                [(key, tokens - 1, now) for key, tokens in levels])
+        if random.random() < PRUNE_CHANCE:
+            # A bucket untouched for the longest period is full again anyway
+            conn.execute("DELETE FROM buckets WHERE updated < ?",
+                         (now - longest_period(),))
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return wait
+
+
+def longest_period():
+    return max((rule[kind][1] for rule in settings.RATE_LIMITS.values()
+                for kind in ('ip', 'account') if kind in rule), default=0)
+
+
+def client_ip(request):
+    header = getattr(settings, 'RATE_LIMIT_IP_HEADER', None)
+    if header and request.META.get(header):
+        # The proxy appends the address it saw, so the last one is trusted
+        return request.META[header].split(',')[-1].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def account_of(request, url_name):
+    """Who the request acts for, without touching the database"""
+    if url_name == 'account_login':
+        return request.POST.get('email', '').strip().lower() or None
+    # SessionMiddleware has run; the session itself is read from the cache
+    return request.session.get('_auth_user_id')
+
+
+def buckets_for(request, url_name):
+    rule = settings.RATE_LIMITS.get(url_name)
+    if rule is None or request.method not in rule.get('methods', ('GET', 'POST')):
+        return []
+    buckets = []
+    if 'ip' in rule:
+        buckets.append(('%s:ip:%s' % (url_name, client_ip(request)),) + tuple(rule['ip']))
+    account = account_of(request, url_name) if 'account' in rule else None
+    if account is not None:
+        buckets.append(('%s:account:%s' % (url_name, account),) + tuple(rule['account']))
+    return buckets
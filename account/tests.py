@@ -1,3 +1,149 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import get_resolver, resolve, reverse
+from django.urls.resolvers import RoutePattern, URLResolver
+
+from . import ratelimit
+from .access import ADMIN, VOTER
+from .management.commands.benchmark_access import legacy_process_view
+from .middleware import AccountCheckMiddleWare
+from .models import CustomUser
+
+# The account URLs are also mounted at '/', and the compiled policy lets
+# anonymous users reach them there rather than bouncing them to /account/
+INTENDED_CHANGES = {
+    ('/', None): ('/account/', None),
+    ('/register/', None): ('/account/', None),
+}
+
+
+def _paths(resolver, prefix='/'):
+    """Every path in the URLconf that takes no arguments"""
+    for pattern in resolver.url_patterns:
+        if not isinstance(pattern.pattern, RoutePattern) or pattern.pattern.converters:
+            continue
+        if isinstance(pattern, URLResolver):
+            yield from _paths(pattern, prefix + str(pattern.pattern))
+        else:
+            yield prefix + str(pattern.pattern)
+
+
+class AccessPolicyTests(SimpleTestCase):
+    def redirect(self, check, path, user):
+        """Where check sends user at path; None lets the request through"""
+        match = resolve(path)
+        request = RequestFactory().get(path)
+        request.user = user
+        request.resolver_match = match
+        request._messages = CookieStorage(request)
+        return getattr(check(request, match.func), 'url', None)
+
+    def test_compiled_policy_matches_the_legacy_check(self):
+        middleware = AccountCheckMiddleWare(lambda request: None)
+        compiled = lambda request, view_func: middleware.process_view(request, view_func, (), {})
+        paths = list(_paths(get_resolver())) + [
+            reverse('update_ballot_position', args=[1, 'up']),
+            reverse('exportData', args=['votes']),
+        ]
+        users = [AnonymousUser(), CustomUser(user_type=ADMIN), CustomUser(user_type=VOTER),
+                 CustomUser(user_type='3')]
+        for path in paths:
+            for user in users:
+                role = getattr(user, 'user_type', None)
+                with self.subTest(path=path, role=role):
+                    legacy = self.redirect(legacy_process_view, path, user)
+                    got = (legacy, self.redirect(compiled, path, user))
+                    self.assertEqual(got, INTENDED_CHANGES.get((path, role), (legacy, legacy)))
+
+
+class RateLimitCase:
+    """Gives each test its own bucket file"""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'ratelimit.sqlite3')
+        limit_settings = override_settings(RATE_LIMIT_PATH=self.path)
+        limit_settings.enable()
+        self.addCleanup(limit_settings.disable)
+        self.addCleanup(self.close)
+
+    def close(self):
+        conn = getattr(ratelimit._local, 'connections', {}).pop(self.path, None)
+        if conn is not None:
+            conn.close()
+
+
+class TokenBucketTests(RateLimitCase, SimpleTestCase):
+    def setUp(self):
+        super().setUp()
+        clock = mock.patch.object(ratelimit, 'time')
+        self.clock = clock.start()
+        self.addCleanup(clock.stop)
+        self.clock.time.return_value = 1000.0
+
+    def test_refills_over_time(self):
+        bucket = [('key', 2, 10)]
+        self.assertEqual(ratelimit.take(bucket), 0)
+        self.assertEqual(ratelimit.take(bucket), 0)
+        self.assertAlmostEqual(ratelimit.take(bucket), 5)
+        self.clock.time.return_value += 2.5
+        self.assertAlmostEqual(ratelimit.take(bucket), 2.5)
+        self.clock.time.return_value += 2.5
+        self.assertEqual(ratelimit.take(bucket), 0)
+        # Never fuller than its size, however long it sat idle
+        self.clock.time.return_value += 3600
+        self.assertEqual(ratelimit.take(bucket), 0)
+        self.assertEqual(ratelimit.take(bucket), 0)
+        self.assertGreater(ratelimit.take(bucket), 0)
+
+    def test_refusal_takes_from_no_bucket(self):
+        ip, account = ('ip', 3, 60), ('account', 1, 60)
+        self.assertEqual(ratelimit.take([ip, account]), 0)
+        self.assertAlmostEqual(ratelimit.take([ip, account]), 60)
+        self.assertAlmostEqual(ratelimit.take([ip, account]), 60)
+        # The two refusals left the IP bucket with its two tokens
+        self.assertEqual(ratelimit.take([ip]), 0)
+        self.assertEqual(ratelimit.take([ip]), 0)
+        self.assertAlmostEqual(ratelimit.take([ip]), 20)
+
+
+LOGIN_LIMIT = {'account_login': {'ip': (100, 60), 'account': (1, 60), 'methods': ['POST']}}
+TEST_CACHES = {
+    alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': alias}
+    for alias in ('default', 'sessions', 'otp')
+}
+
+
+@override_settings(CACHES=TEST_CACHES, RATE_LIMITS=LOGIN_LIMIT)
+class RateLimitMiddlewareTests(RateLimitCase, TestCase):
+    def login(self, email, **headers):
+        return self.client.post(reverse('account_login'),
+                                {'email': email, 'password': 'wrong'}, headers=headers)
+
+    def test_login_is_limited_per_posted_email(self):
+        self.assertEqual(self.login('voter@example.com').status_code, 302)
+        refused = self.login(' Voter@Example.com ')
+        self.assertEqual(refused.status_code, 429)
+        self.assertEqual(refused['Retry-After'], '60')
+        self.assertEqual(refused['Content-Type'], 'text/plain')
+        self.assertIn(b"try again in 60 seconds", refused.content)
+        # Another account from the same address is still let through
+        self.assertEqual(self.login('other@example.com').status_code, 302)
+
+    def test_ajax_refusal_is_json(self):
+        self.login('voter@example.com')
+        refused = self.login('voter@example.com', x_requested_with='XMLHttpRequest')
+        self.assertEqual(refused.status_code, 429)
+        self.assertEqual(refused['Retry-After'], '60')
+        self.assertTrue(refused.json()['error'])
+
+    def test_unlimited_methods_pass(self):
+        for _ in range(3):
+            self.assertEqual(self.client.get(reverse('account_login')).status_code, 200)
@@ -1,5 +1,6 @@
 from django.shortcuts import render, redirect, reverse
 from .email_backend import EmailBackend
+from .admission import LoginBusy
 from django.contrib import messages
 from .forms import CustomUserForm
 from voting.forms import VoterForm
@@ -16,8 +17,15 @@ def account_login(request):
 
     context = {}
     if request.method == 'POST':
-        user = EmailBackend.authenticate(request, username=request.POST.get(
-            'email'), password=request.POST.get('password'))
+        try:
+            user = EmailBackend.authenticate(request, username=request.POST.get(
+                'email'), password=request.POST.get('password'))
+        except LoginBusy as busy:
+            messages.error(request, "Too many people are logging in right now. "
+                           "Please try again in a few seconds")
+            response = render(request, "voting/login.html", context, status=503)
+            response['Retry-After'] = str(busy.retry_after)
+            return response
         if user != None:
             login(request, user)
             if user.user_type == '1':
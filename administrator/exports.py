@@ -0,0 +1,74 @@
+"""Streaming exports of votes, turnout and tallies as CSV or JSONL.
+Rows are pulled from the database with QuerySet.iterator(), so memory
+use stays flat however many rows are exported.
+"""
+import csv
+import json
+
+from voting.models import Votes, Voter
+from voting.tally import current_results
+
+CHUNK_SIZE = 2000
+
+
+class Echo:
+    """File-like object whose write() hands back what it is given, so
+    csv.writer can format one row at a time
+    """
+
+    def write(self, value):
+        return value
+
+
+def votes_rows():
+    yield ['vote_id', 'voter_id', 'voter_email', 'position', 'candidate_id', 'candidate']
+    yield from Votes.objects.order_by('id').values_list(
+        'id', 'voter_id', 'voter__admin__email', 'position__name',
+        'candidate_id', 'candidate__fullname').iterator(chunk_size=CHUNK_SIZE)
+
+
+def turnout_rows():
+    yield ['voter_id', 'email', 'last_name', 'first_name', 'phone', 'verified', 'voted']
+    yield from Voter.objects.order_by('id').values_list(
+        'id', 'admin__email', 'admin__last_name', 'admin__first_name',
+        'phone', 'verified', 'voted').iterator(chunk_size=CHUNK_SIZE)
+
+
+def tally_rows():
+    yield ['position', 'candidate_id', 'candidate', 'votes', 'rank', 'outcome']
+    for result in current_results():
+        winners = {ranked.candidate.id for ranked in result.winners}
+        tied = {ranked.candidate.id for ranked in result.tied}
+        for ranked in result.ranking:
+            outcome = ''
+            if ranked.candidate.id in winners:
+                outcome = 'winner'
+            elif ranked.candidate.id in tied:
+                outcome = 'tied'
+            yield [result.position.name, ranked.candidate.id,
+                   ranked.candidate.fullname, ranked.votes, ranked.rank, outcome]
+
+
+DATASETS = {
+    'votes': votes_rows,
+    'turnout': turnout_rows,
+    'tally': tally_rows,
+}
+
+
+def as_csv(rows):
+    writer = csv.writer(Echo())
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def as_jsonl(rows):
+    header = next(rows)
+    for row in rows:
+        yield json.dumps(dict(zip(header, row))) + "\n"
+
+
+FORMATS = {
+    'csv': (as_csv, 'text/csv'),
+    'jsonl': (as_jsonl, 'application/x-ndjson'),
+}
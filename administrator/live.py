@@ -0,0 +1,106 @@
+"""Live results pushed to admin dashboards as Server-Sent Events
+
+Every ASGI worker process runs at most one producer task. While at least
+one dashboard is listening it computes the tally and turnout once per
+LIVE_RESULTS_INTERVAL seconds and wakes every listener, so 100 watching
+admins cost one computation per tick, not 100. Each listener then sends
+its client only what changed since the last event it sent. A tick that
+fails (e.g. "database is locked") is logged and the next one tries
+again; listeners send a keep-alive whenever no tick arrives for
+KEEPALIVE_SECONDS.
+"""
+import asyncio
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from voting.models import Voter
+from voting.tally import vote_counts
+
+logger = logging.getLogger(__name__)
+
+KEEPALIVE_SECONDS = 15
+
+
+def current_results():
+    return {
+        'voters': Voter.objects.count(),
+        'voted': Voter.objects.filter(voted=True).count(),
+        'votes': {str(candidate_id): votes
+                  for candidate_id, votes in vote_counts(live=True).items()},
+    }
+
+
+def results_delta(sent, state):
+    """The part of state that differs from what was sent already"""
+    delta = {key: state[key] for key in ('voters', 'voted')
+             if sent.get(key) != state[key]}
+    sent_votes = sent.get('votes', {})
+    votes = {candidate_id: count for candidate_id, count in state['votes'].items()
+             if sent_votes.get(candidate_id, 0) != count}
+    # Candidates whose votes were reset away are sent back as 0
+    votes.update({candidate_id: 0 for candidate_id in sent_votes
+                  if candidate_id not in state['votes']})
+    if votes:
+        delta['votes'] = votes
+    return delta
+
+
+class ResultsBroadcaster:
+    def __init__(self):
+        self.state = None
+        self.tick = 0
+        self.listeners = 0
+        self.changed = None
+        self.producer = None
+
+    async def produce(self):
+        while self.listeners:
+            try:
+                state = await sync_to_async(current_results)()
+            except Exception:
+                logger.exception("Computing live results failed")
+            else:
+                self.state = state
+                self.tick += 1
+                async with self.changed:
+                    self.changed.notify_all()
+            await asyncio.sleep(settings.LIVE_RESULTS_INTERVAL)
+
+    def ensure_producer(self):
+        if self.producer is None or self.producer.done():
+            self.producer = asyncio.ensure_future(self.produce())
+
+    async def events(self):
+        if self.changed is None:
+            self.changed = asyncio.Condition()
+        self.listeners += 1
+        self.ensure_producer()
+        sent = {}
+        seen = 0
+        try:
+            yield "retry: %d\n\n" % (settings.LIVE_RESULTS_INTERVAL * 1000)
+            while True:
+                try:
+                    async with self.changed:
+                        await asyncio.wait_for(
+                            self.changed.wait_for(lambda: self.tick > seen),
+                            KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    self.ensure_producer()  # In case it died all the same
+                    yield ": keep-alive\n\n"
+                    continue
+                seen = self.tick
+                delta = results_delta(sent, self.state)
+                sent = self.state
+                if delta:
+                    yield "event: tally\ndata: %s\n\n" % json.dumps(delta)
+                else:
+                    yield ": keep-alive\n\n"
+        finally:
+            self.listeners -= 1
+
+
+broadcaster = ResultsBroadcaster()
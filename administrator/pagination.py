@@ -0,0 +1,62 @@
+"""Keyset (seek) pagination for the admin JSON endpoints.
+A page is fetched with WHERE (field, id) > (last value, last id) instead
+of OFFSET, so page N costs the same as page 1.
+"""
+import base64
+import json
+from functools import reduce
+
+from django.db.models import Q
+
+
+def encode_cursor(value, pk):
+    return base64.urlsafe_b64encode(json.dumps([value, pk]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Raises ValueError on a cursor that was not made by encode_cursor"""
+    try:
+        value, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return value, pk
+
+
+def field_value(obj, field):
+    """Follow a 'voter__admin__last_name' style path on a model instance"""
+    return reduce(getattr, field.split('__'), obj)
+
+
+def keyset_page(queryset, field, cursor=None, limit=50, descending=False):
+    """Return (objects, next cursor or None) for one page ordered by (field, id)"""
+    prefix = '-' if descending else ''
+    queryset = queryset.order_by(prefix + field, prefix + 'id')
+    if cursor:
+        value, pk = decode_cursor(cursor)
+        op = 'lt' if descending else 'gt'
+        if field == 'id':
+            queryset = queryset.filter(**{'id__' + op: pk})
+        else:
+            queryset = queryset.filter(
+                Q(**{field + '__' + op: value}) | Q(**{field: value, 'id__' + op: pk}))
+    objects = list(queryset[:limit + 1])
+    if len(objects) <= limit:
+        return objects, None
+    objects = objects[:limit]
+    last = objects[-1]
+    return objects, encode_cursor(field_value(last, field), last.id)
+
+
+def page_request(request, sorts, default='id', max_limit=500):
+    """Read ?sort=[-]name, ?cursor= and ?limit= for keyset_page.
+    Returns (field, descending, cursor, limit); raises ValueError on bad input.
+    """
+    sort = request.GET.get('sort', default)
+    descending = sort.startswith('-')
+    field = sorts.get(sort.lstrip('-'))
+    if field is None:
+        raise ValueError("Unknown sort")
+    limit = int(request.GET.get('limit', 50))
+    if limit < 1:
+        raise ValueError("Invalid limit")
+    return field, descending, request.GET.get('cursor') or None, min(limit, max_limit)
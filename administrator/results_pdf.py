@@ -0,0 +1,114 @@
+"""Results PDF cache and background rendering
+
+A rendered PDF is stored in RESULTS_PDF_DIR under a key derived from the
+ballot revision, the results revision, the replica snapshot the results
+were read from (if any) and the election title, so repeated downloads of
+unchanged results are served from disk. A missing PDF is rendered by
+WeasyPrint in a process pool, never in the request thread.
+While a render runs a '<key>.rendering' marker lets every worker on the
+node see it; a failed render leaves '<key>.failed' with the error.
+Superseded PDFs are kept for PDF_GRACE_SECONDS before they are pruned.
+"""
+import glob
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+
+from voting import replica
+from voting.ballot import ballot_revision, results_revision
+
+STALE_RENDER_SECONDS = 300  # A marker this old belongs to a render that died
+# Older PDFs may still be downloading or polled for, so they are only
+# pruned once a newer one has landed and they are this old
+PDF_GRACE_SECONDS = 600
+
+_executor = None
+
+
+def results_key(title):
+    read = replica.current()
+    # Counts from a replica are as old as its copy, whatever the revision says
+    snapshot = read.copied_at if read is not None else ''
+    stamp = "%s:%s:%s:%s" % (ballot_revision(), results_revision(), snapshot, title)
+    return hashlib.sha1(stamp.encode()).hexdigest()[:20]
+
+
+def _path(key, suffix):
+    return os.path.join(settings.RESULTS_PDF_DIR, key + suffix)
+
+
+def status(key):
+    """'ready', 'rendering', 'failed' or None (never requested)"""
+    if os.path.exists(_path(key, '.pdf')):
+        return 'ready'
+    marker = _path(key, '.rendering')
+    try:
+        if time.time() - os.path.getmtime(marker) < STALE_RENDER_SECONDS:
+            return 'rendering'
+        os.remove(marker)
+    except FileNotFoundError:
+        pass
+    if os.path.exists(_path(key, '.failed')):
+        return 'failed'
+    return None
+
+
+def pdf_path(key):
+    return _path(key, '.pdf')
+
+
+def _init_worker():
+    django.setup()
+
+
+def _render(template, context, path):
+    from django_renderpdf.helpers import render_pdf
+    partial = path + '.part'
+    with open(partial, 'wb') as file_:
+        render_pdf(template=template, file_=file_, context=context)
+    os.replace(partial, path)
+
+
+def start(key, template, context):
+    """Queue a render of this key unless one is ready or running already.
+    context must be picklable (it crosses into the render process).
+    """
+    global _executor
+    os.makedirs(settings.RESULTS_PDF_DIR, exist_ok=True)
+    if status(key) in ('ready', 'rendering'):
+        return
+    try:
+        os.close(os.open(_path(key, '.rendering'), os.O_CREAT | os.O_EXCL))
+    except FileExistsError:
+        return  # Another worker got there first
+    for stale in glob.glob(_path(key, '.failed')):
+        os.remove(stale)
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.RESULTS_PDF_WORKERS, initializer=_init_worker)
+    future = _executor.submit(_render, template, context, pdf_path(key))
+    future.add_done_callback(lambda future: _finished(key, future))
+
+
+def _finished(key, future):
+    error = future.exception()
+    if error is not None:
+        with open(_path(key, '.failed'), 'w') as file_:
+            file_.write(repr(error))
+    else:
+        # Only the newest results are worth keeping, once the grace is over
+        expired = time.time() - PDF_GRACE_SECONDS
+        for old in glob.glob(os.path.join(settings.RESULTS_PDF_DIR, '*.pdf')):
+            try:
+                if old != pdf_path(key) and os.path.getmtime(old) < expired:
+                    os.remove(old)
+            except FileNotFoundError:
+                pass  # Pruned by another worker
+    try:
+        os.remove(_path(key, '.rendering'))
+    except FileNotFoundError:
+        pass
@@ -1,3 +1,67 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import Future
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, override_settings
+
+from . import live, results_pdf
+
+STATE = {'voters': 3, 'voted': 1, 'votes': {'1': 1}}
+
+
+@override_settings(LIVE_RESULTS_INTERVAL=0)
+class BroadcasterTests(SimpleTestCase):
+    async def next_events(self, events, count):
+        return [await events.__anext__() for _ in range(count)]
+
+    async def test_failed_tick_does_not_stop_the_producer(self):
+        broadcaster = live.ResultsBroadcaster()
+        results = mock.Mock(side_effect=[Exception("database is locked")] + [STATE] * 10)
+        with mock.patch.object(live, 'current_results', results), \
+                self.assertLogs('administrator.live', 'ERROR'):
+            events = broadcaster.events()
+            retry, tally = await self.next_events(events, 2)
+            await events.aclose()
+        self.assertTrue(retry.startswith("retry:"))
+        self.assertTrue(tally.startswith("event: tally\n"))
+        self.assertIn('"voted": 1', tally)
+
+    @mock.patch.object(live, 'KEEPALIVE_SECONDS', 0.05)
+    async def test_keep_alive_without_ticks(self):
+        broadcaster = live.ResultsBroadcaster()
+        with mock.patch.object(live, 'current_results', side_effect=Exception("down")), \
+                self.assertLogs('administrator.live', 'ERROR'):
+            events = broadcaster.events()
+            _, keep_alive = await self.next_events(events, 2)
+            await events.aclose()
+        self.assertEqual(keep_alive, ": keep-alive\n\n")
+
+
+class ResultsPdfTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        pdf_settings = override_settings(RESULTS_PDF_DIR=directory)
+        pdf_settings.enable()
+        self.addCleanup(pdf_settings.disable)
+
+    def write(self, key, age=0):
+        path = results_pdf.pdf_path(key)
+        open(path, 'wb').close()
+        then = time.time() - age
+        os.utime(path, (then, then))
+
+    def test_new_render_keeps_recent_pdfs(self):
+        self.write('old', age=results_pdf.PDF_GRACE_SECONDS + 60)
+        self.write('previous', age=5)
+        self.write('new')
+        open(results_pdf._path('new', '.rendering'), 'w').close()
+        done = Future()
+        done.set_result(None)
+        results_pdf._finished('new', done)
+        self.assertEqual(results_pdf.status('new'), 'ready')
+        self.assertEqual(results_pdf.status('previous'), 'ready')
+        self.assertIsNone(results_pdf.status('old'))
@@ -4,11 +4,16 @@ from . import views
 
 urlpatterns = [
     path('', views.dashboard, name="adminDashboard"),
+    path('results/live', views.live_results, name="liveResults"),
+    path('metrics/login', views.login_metrics, name="loginMetrics"),
     # * Voters
     path('voters', views.voters, name="adminViewVoters"),
+    path('voters/data', views.voters_data, name="viewVotersData"),
     path('voters/view', views.view_voter_by_id, name="viewVoter"),
     path('voters/delete', views.deleteVoter, name='deleteVoter'),
     path('voters/update', views.updateVoter, name="updateVoter"),
+    path('voters/import', views.import_voters, name="importVoters"),
+    path('voters/import/status', views.import_voters_status, name="importVotersStatus"),
 
     # * Position
     path('position/view', views.view_position_by_id, name="viewPosition"),
@@ -30,8 +35,11 @@ urlpatterns = [
 
     # * Votes
     path('votes/view', views.viewVotes, name='viewVotes'),
+    path('votes/data', views.votes_data, name='viewVotesData'),
     path('votes/reset/', views.resetVote, name='resetVote'),
+    path('votes/export/<str:dataset>/', views.export_data, name='exportData'),
     path('votes/print/', views.PrintView.as_view(), name='printResult'),
+    path('votes/print/status', views.print_result_status, name='printResultStatus'),
 
 
 
@@ -1,35 +1,35 @@
 from django.shortcuts import render, reverse, redirect
-from voting.models import Voter, Position, Candidate, Votes
+from voting.models import Voter, Position, Candidate, Votes, CandidateTally
 from account.models import CustomUser
 from account.forms import CustomUserForm
+from account import admission
 from voting.forms import *
+from voting.ballot import renumber_positions, bump_results_revision_on_commit, get_snapshot
+from voting import journal, live_tally
+from voting import tally, voter_import, election, replica
+from voting import otp as otp_store
+from voting.replica import reads_from_replica
+from voting.write_gate import write_gate
+from voting.tabulation import summarize
+from .live import broadcaster, current_results
+from . import results_pdf, exports
+from .pagination import keyset_page, page_request
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponse
-from django.conf import settings
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse, FileResponse
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.decorators import method_decorator
 import json  # Not used
 from django_renderpdf.views import PDFView
 
 
-def find_n_winners(data, n):
-    """Read More
-    https://www.geeksforgeeks.org/python-program-to-find-n-largest-elements-from-a-list/
-    """
-    final_list = []
-    candidate_data = data[:]
-    # print("Candidate = ", str(candidate_data))
-    for i in range(0, n):
-        max1 = 0
-        if len(candidate_data) == 0:
-            continue
-        this_winner = max(candidate_data, key=lambda x: x['votes'])
-        # TODO: Check if None
-        this = this_winner['name'] + \
-            " with " + str(this_winner['votes']) + " votes"
-        final_list.append(this)
-        candidate_data.remove(this_winner)
-    return ", &nbsp;".join(final_list)
-
-
+@method_decorator(reads_from_replica, name='dispatch')
 class PrintView(PDFView):
     template_name = 'admin/print.html'
     prompt_download = True
@@ -38,99 +38,122 @@ class PrintView(PDFView):
     def download_name(self):
         return "result.pdf"
 
+    def get_title(self):
+        return election.current().title
+
+    def get(self, request, *args, **kwargs):
+        """Serve the cached PDF of the current results; if there is none
+        yet, have it rendered in the background instead of waiting on it
+        """
+        key = results_pdf.results_key(self.get_title())
+        if results_pdf.status(key) == 'ready':
+            return FileResponse(open(results_pdf.pdf_path(key), 'rb'), as_attachment=True,
+                                filename=self.download_name, content_type='application/pdf')
+        self.start_render(key)
+        messages.info(
+            request, "The result PDF is being prepared, download it again in a moment")
+        return redirect(reverse('adminDashboard'))
+
+    def start_render(self, key):
+        context = self.get_context_data()
+        context.pop('view', None)  # Only plain data crosses into the render process
+        results_pdf.start(key, self.get_template_names(), context)
+
     def get_context_data(self, *args, **kwargs):
-        title = "E-voting"
-        try:
-            file = open(settings.ELECTION_TITLE_PATH, 'r')
-            title = file.read()
-        except:
-            pass
+        title = self.get_title()
         context = super().get_context_data(*args, **kwargs)
         position_data = {}
-        for position in Position.objects.all():
-            candidate_data = []
-            winner = ""
-            for candidate in Candidate.objects.filter(position=position):
-                this_candidate_data = {}
-                votes = Votes.objects.filter(candidate=candidate).count()
-                this_candidate_data['name'] = candidate.fullname
-                this_candidate_data['votes'] = votes
-                candidate_data.append(this_candidate_data)
-            print("Candidate Data For  ", str(
-                position.name), " = ", str(candidate_data))
-            # ! Check Winner
-            if len(candidate_data) < 1:
-                winner = "Position does not have candidates"
-            else:
-                # Check if max_vote is more than 1
-                if position.max_vote > 1:
-                    winner = find_n_winners(candidate_data, position.max_vote)
-                else:
-
-                    winner = max(candidate_data, key=lambda x: x['votes'])
-                    if winner['votes'] == 0:
-                        winner = "No one voted for this yet position, yet."
-                    else:
-                        """
-                        https://stackoverflow.com/questions/18940540/how-can-i-count-the-occurrences-of-an-item-in-a-list-of-dictionaries
-                        """
-                        count = sum(1 for d in candidate_data if d.get(
-                            'votes') == winner['votes'])
-                        if count > 1:
-                            winner = f"There are {count} candidates with {winner['votes']} votes"
-                        else:
-                            winner = "Winner : " + winner['name']
-            print("Candidate Data For  ", str(
-                position.name), " = ", str(candidate_data))
+        for result in tally.current_results():
+            position = result.position
+            votes = {ranked.candidate.id: ranked.votes for ranked in result.ranking}
+            candidate_data = [
+                {'name': candidate.fullname, 'votes': votes[candidate.id]}
+                for candidate in position.candidates
+            ]
             position_data[position.name] = {
-                'candidate_data': candidate_data, 'winner': winner, 'max_vote': position.max_vote}
+                'candidate_data': candidate_data,
+                'winner': summarize(result, separator=", &nbsp;"),
+                'max_vote': position.max_vote}
+        context['title'] = title
         context['positions'] = position_data
-        print(context)
         return context
 
 
+@reads_from_replica
+def print_result_status(request):
+    """Where the result PDF of the current results stands; asking also
+    starts its render if needed. The dashboard polls this before downloading.
+    """
+    view = PrintView()
+    view.setup(request)
+    key = results_pdf.results_key(view.get_title())
+    status = results_pdf.status(key)
+    if status != 'ready' and status != 'rendering':
+        view.start_render(key)
+        status = results_pdf.status(key) or 'rendering'
+    return JsonResponse({'status': status, 'url': reverse('printResult')})
+
+
+@reads_from_replica
 def dashboard(request):
-    positions = Position.objects.all().order_by('priority')
-    candidates = Candidate.objects.all()
+    results = tally.current_results(live=True)
+    positions = [result.position for result in results]
     voters = Voter.objects.all()
     voted_voters = Voter.objects.filter(voted=1)
-    list_of_candidates = []
-    votes_count = []
     chart_data = {}
 
-    for position in positions:
-        list_of_candidates = []
-        votes_count = []
-        for candidate in Candidate.objects.filter(position=position):
-            list_of_candidates.append(candidate.fullname)
-            votes = Votes.objects.filter(candidate=candidate).count()
-            votes_count.append(votes)
-        chart_data[position] = {
-            'candidates': list_of_candidates,
-            'votes': votes_count,
-            'pos_id': position.id
+    for result in results:
+        position = result.position
+        votes = {ranked.candidate.id: ranked.votes for ranked in result.ranking}
+        chart_data[position.name] = {
+            'candidates': [candidate.fullname for candidate in position.candidates],
+            'ids': [candidate.id for candidate in position.candidates],
+            'votes': [votes[candidate.id] for candidate in position.candidates],
+            'pos_id': position.id,
+            'summary': summarize(result),
         }
 
     context = {
-        'position_count': positions.count(),
-        'candidate_count': candidates.count(),
+        'position_count': len(positions),
+        'candidate_count': sum(len(position.candidates) for position in positions),
         'voters_count': voters.count(),
         'voted_voters_count': voted_voters.count(),
         'positions': positions,
         'chart_data': chart_data,
+        # Server-Sent Events need an ASGI server (see e_voting/asgi.py)
+        'live_stream': isinstance(request, ASGIRequest),
+        'replica': replica.status(),
         'page_title': "Dashboard"
     }
     return render(request, "admin/home.html", context)
 
 
+async def live_results(request):
+    """Push tally deltas and turnout to the dashboard as Server-Sent Events.
+    A WSGI worker cannot hold the stream open, so there it answers once
+    with the current results as JSON.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse(await sync_to_async(current_results)())
+    response = StreamingHttpResponse(
+        broadcaster.events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Keep proxies from buffering events
+    return response
+
+
+def login_metrics(request):
+    """Login admission: hashing slots in use, queue depth and hash latency"""
+    return JsonResponse(admission.node_status())
+
+
 def voters(request):
-    voters = Voter.objects.all()
+    # The list itself is fetched page by page from voters_data
     userForm = CustomUserForm(request.POST or None)
     voterForm = VoterForm(request.POST or None)
     context = {
         'form1': userForm,
         'form2': voterForm,
-        'voters': voters,
         'page_title': 'Voters List'
     }
     if request.method == 'POST':
@@ -146,6 +169,77 @@ def voters(request):
     return render(request, "admin/voters.html", context)
 
 
+def import_voters(request):
+    """Start a bulk import of the uploaded CSV; the page polls its status"""
+    if request.method != 'POST' or 'file' not in request.FILES:
+        return JsonResponse({'error': "Upload a CSV file"}, status=400)
+    job_id = voter_import.start_job(request.FILES['file'])
+    return JsonResponse({'job': job_id})
+
+
+def import_voters_status(request):
+    status = voter_import.job_status(request.GET.get('job', ''))
+    if status is None:
+        return JsonResponse({'error': "Unknown import"}, status=404)
+    return JsonResponse(status)
+
+
+# Only orders an index on voting_voter can serve, so pages stay flat in cost
+VOTER_SORTS = {
+    'id': 'id',
+}
+
+
+def prefix_range(prefix):
+    """(lower, upper) bounds matching every string that starts with prefix.
+    Range lookups (unlike LIKE) can always be answered from an index.
+    """
+    return prefix, prefix + '\U0010ffff'
+
+
+def search_voters(voters, query):
+    """Filter by email prefix (query has an @), phone prefix (digits only)
+    or case-insensitive first/last name prefix
+    """
+    query = query.strip()
+    if not query:
+        return voters
+    if '@' in query:
+        low, high = prefix_range(query.lower())
+        return voters.filter(admin__email__gte=low, admin__email__lt=high)
+    if query.isdigit():
+        low, high = prefix_range(query)
+        return voters.filter(phone__gte=low, phone__lt=high)
+    low, high = prefix_range(query.lower())
+    return voters.alias(
+        last_lower=Lower('admin__last_name'), first_lower=Lower('admin__first_name')
+    ).filter(Q(last_lower__gte=low, last_lower__lt=high) |
+             Q(first_lower__gte=low, first_lower__lt=high))
+
+
+def voters_data(request):
+    """One keyset page of the voter directory as JSON.
+    ?q= searches (see search_voters), ?sort= is one of VOTER_SORTS
+    (prefix - to reverse), ?cursor= is the 'next' of the previous page.
+    """
+    voters = Voter.objects.select_related('admin').only(
+        'phone', 'admin__first_name', 'admin__last_name', 'admin__email')
+    voters = search_voters(voters, request.GET.get('q', ''))
+    try:
+        field, descending, cursor, limit = page_request(request, VOTER_SORTS)
+        page, next_cursor = keyset_page(voters, field, cursor, limit, descending)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    rows = [{
+        'id': voter.id,
+        'first_name': voter.admin.first_name,
+        'last_name': voter.admin.last_name,
+        'email': voter.admin.email,
+        'phone': voter.phone,
+    } for voter in page]
+    return JsonResponse({'rows': rows, 'next': next_cursor})
+
+
 def view_voter_by_id(request):
     voter_id = request.GET.get('id', None)
     voter = Voter.objects.filter(id=voter_id)
@@ -198,8 +292,15 @@ def deleteVoter(request):
     if request.method != 'POST':
         messages.error(request, "Access Denied")
     try:
-        admin = Voter.objects.get(id=request.POST.get('id')).admin
-        admin.delete()
+        voter = Voter.objects.get(id=request.POST.get('id'))
+        voter_id = voter.id
+        with transaction.atomic():
+            CandidateTally.objects.remove_votes(
+                Votes.objects.filter(voter=voter).values_list('candidate_id', flat=True))
+            voter.admin.delete()
+            live_tally.invalidate()
+            bump_results_revision_on_commit()
+        journal.forget_voter(voter_id)
         messages.success(request, "Voter Has Been Deleted")
     except:
         messages.error(request, "Access To This Resource Denied")
@@ -245,7 +346,10 @@ def deletePosition(request):
         messages.error(request, "Access Denied")
     try:
         pos = Position.objects.get(id=request.POST.get('id'))
+        candidate_ids = list(pos.candidate_set.values_list('id', flat=True))
         pos.delete()
+        journal.forget_candidates(candidate_ids)
+        renumber_positions()
         messages.success(request, "Position Has Been Deleted")
     except:
         messages.error(request, "Access To This Resource Denied")
@@ -294,7 +398,9 @@ def deleteCandidate(request):
         messages.error(request, "Access Denied")
     try:
         pos = Candidate.objects.get(id=request.POST.get('id'))
+        candidate_id = pos.id
         pos.delete()
+        journal.forget_candidates([candidate_id])
         messages.success(request, "Candidate Has Been Deleted")
     except:
         messages.error(request, "Access To This Resource Denied")
@@ -359,6 +465,16 @@ def update_ballot_position(request, position_id, up_or_down):
     return JsonResponse(context)
 
 
+def parse_window_time(value):
+    """A datetime-local input's value, in the current time zone; '' is None"""
+    if not value:
+        return None
+    moment = parse_datetime(value)
+    if moment is None:
+        raise ValidationError("Invalid date and time " + value)
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+
+
 def ballot_title(request):
     from urllib.parse import urlparse
     url = urlparse(request.META['HTTP_REFERER']).path
@@ -366,28 +482,92 @@ def ballot_title(request):
     try:
         redirect_url = resolve(url)
         title = request.POST.get('title', 'No Name')
-        file = open(settings.ELECTION_TITLE_PATH, 'w')
-        file.write(title)
-        file.close()
-        messages.success(
-            request, "Election title has been changed to " + str(title))
+        fields = {'title': title}
+        if 'otp_mode' in request.POST:
+            fields['otp_mode'] = request.POST['otp_mode']
+        for name in ('voting_opens', 'voting_closes'):
+            if name in request.POST:
+                fields[name] = parse_window_time(request.POST[name])
+        election.update(**fields)
+        messages.success(request, "Election settings have been saved")
+        return redirect(url)
+    except ValidationError as e:
+        messages.error(request, "; ".join(e.messages))
         return redirect(url)
     except Exception as e:
         messages.error(request, e)
         return redirect("/")
 
 
+@reads_from_replica
 def viewVotes(request):
-    votes = Votes.objects.all()
+    # Rows are fetched page by page from votes_data
     context = {
-        'votes': votes,
+        'positions': get_snapshot().positions,
         'page_title': 'Votes'
     }
     return render(request, "admin/votes.html", context)
 
 
+VOTE_SORTS = {
+    'id': 'id',
+    'voter': 'voter__admin__last_name',
+    'candidate': 'candidate__fullname',
+    'position': 'position__priority',
+}
+
+
+@reads_from_replica
+def votes_data(request):
+    """One keyset page of the vote audit table as JSON.
+    ?position= and ?candidate= filter by id, ?sort= is one of VOTE_SORTS
+    (prefix - to reverse), ?cursor= is the 'next' of the previous page.
+    """
+    votes = Votes.objects.select_related('voter__admin', 'candidate', 'position').only(
+        'voter__admin__first_name', 'voter__admin__last_name',
+        'candidate__fullname', 'position__name', 'position__priority')
+    try:
+        if request.GET.get('position'):
+            votes = votes.filter(position_id=int(request.GET['position']))
+        if request.GET.get('candidate'):
+            votes = votes.filter(candidate_id=int(request.GET['candidate']))
+        field, descending, cursor, limit = page_request(request, VOTE_SORTS)
+        page, next_cursor = keyset_page(votes, field, cursor, limit, descending)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    rows = [{
+        'id': vote.id,
+        'voter': vote.voter.admin.last_name + ", " + vote.voter.admin.first_name,
+        'candidate': vote.candidate.fullname,
+        'position': vote.position.name,
+    } for vote in page]
+    return JsonResponse({'rows': rows, 'next': next_cursor})
+
+
+@reads_from_replica
+def export_data(request, dataset):
+    """Stream votes, turnout or tally as CSV (default) or JSONL (?format=jsonl)"""
+    fmt = request.GET.get('format', 'csv')
+    if dataset not in exports.DATASETS or fmt not in exports.FORMATS:
+        messages.error(request, "Unknown export")
+        return redirect(reverse('viewVotes'))
+    encode, content_type = exports.FORMATS[fmt]
+    response = StreamingHttpResponse(
+        encode(exports.DATASETS[dataset]()), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{dataset}.{fmt}"'
+    return response
+
+
 def resetVote(request):
-    Votes.objects.all().delete()
-    Voter.objects.all().update(voted=False, verified=False, otp=None)
+    # One transaction in the write gate, so no ballot lands halfway through
+    with write_gate(), transaction.atomic():
+        Votes.objects.all().delete()
+        CandidateTally.objects.reset()
+        Voter.objects.all().update(voted=False, verified=False)
+        otp_store.reset()
+        # The journal committer also needs the gate, so it cannot drain in between
+        transaction.on_commit(journal.reset)
+        live_tally.invalidate()
+        bump_results_revision_on_commit()
     messages.success(request, "All votes has been reset")
     return redirect(reverse('viewVotes'))
@@ -5,6 +5,10 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
+
+Serve through this entry point to get the live results stream on the admin
+dashboard, e.g. with gunicorn's uvicorn worker:
+    gunicorn e_voting.asgi:application -k uvicorn.workers.UvicornWorker
 """
 
 import os
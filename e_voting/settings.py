@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/3.1/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -46,6 +47,7 @@ MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Added for serving static files
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'account.middleware.RateLimitMiddleware',  # Before any view work
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -78,10 +80,31 @@ WSGI_APPLICATION = 'e_voting.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
 
+# SQLite profile for many gunicorn workers writing at once: WAL lets reads
+# run alongside the writer, IMMEDIATE transactions take the write lock at
+# BEGIN (a deferred one can fail to upgrade with "database is locked"
+# whatever the timeout), and busy_timeout makes writers wait for it.
+SQLITE_OPTIONS = {
+    'transaction_mode': 'IMMEDIATE',
+    'init_command': ';'.join([
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',  # Durable across app crashes; WAL keeps it consistent
+        'PRAGMA busy_timeout=10000',
+        'PRAGMA mmap_size=268435456',  # 256MB
+        'PRAGMA cache_size=-65536',  # 64MB per connection
+        'PRAGMA temp_store=MEMORY',
+    ]),
+}
+
+# Hot write paths (ballot submission, the journal committer) queue on a
+# node-wide lock before BEGIN instead of retrying SQLite's busy lock
+SQLITE_WRITE_GATE = True
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': SQLITE_OPTIONS,
     }
     # Uncomment below for MySQL
     # 'default': {
@@ -93,6 +116,52 @@ DATABASES = {
     # }
 }
 
+# Read replica for the admin's analytics views (voting/replica.py): reads
+# of votes, voters and tallies there go to REPLICA_DATABASE while its copy
+# is at most REPLICA_MAX_LAG seconds old, else to the primary. Locally the
+# replica is a SQLite copy kept fresh by `python manage.py refresh_replica --every 30`.
+REPLICA_PATH = None  # e.g. BASE_DIR / 'replica.sqlite3'
+if REPLICA_PATH:
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': REPLICA_PATH,
+        'OPTIONS': {'init_command': 'PRAGMA query_only=1'},
+    }
+REPLICA_DATABASE = 'replica' if REPLICA_PATH else None
+REPLICA_MAX_LAG = 120
+DATABASE_ROUTERS = ['voting.replica.ReplicaRouter']
+
+# Cache
+# File based so every gunicorn worker on the node shares it (ballot HTML, revision stamps)
+# Once a file cache holds MAX_ENTRIES it deletes a random third of its
+# entries, so 'default' (revision stamps, per-voter SMS delivery status)
+# is sized well above the electorate; sessions get a cache of their own.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+        'OPTIONS': {'MAX_ENTRIES': 50000},
+    },
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'sessions'),
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+    # OTPs must never be culled: a culled code is refused as invalid
+    'otp': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'otp'),
+        'OPTIONS': {'MAX_ENTRIES': 1000000},
+    },
+}
+
+# Sessions are read through the cache (written through to the database), so
+# a logged-in page costs one query for identity: the user joined to its voter.
+# A session culled from its cache is just read from the database again.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+SESSION_CACHE_ALIAS = 'sessions'
+
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
 
@@ -139,8 +208,86 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 AUTH_USER_MODEL = 'account.CustomUser'
 AUTHENTICATION_BACKENDS = ['account.email_backend.EmailBackend']
 
-# Election title path
-ELECTION_TITLE_PATH = os.path.join(BASE_DIR, 'election_title.txt')  # Election Title File
-
-# OTP settings
-SEND_OTP = False  # If False, use 0000 as OTP
+# Election settings (title, OTP mode, voting window) are kept in the
+# ElectionSettings row and edited from the admin's Configure dialog. Each
+# worker rechecks its cached copy every ELECTION_SETTINGS_TTL seconds.
+ELECTION_SETTINGS_TTL = 5
+
+# Only read by the migration that created ElectionSettings, to carry over
+# the title file and the OTP switch (False: bypass OTP, use 0000)
+ELECTION_TITLE_PATH = os.path.join(BASE_DIR, 'election_title.txt')
+SEND_OTP = False
+
+# Vote ingestion
+# 'direct': submit_ballot writes the Votes rows inside the request
+# 'journal': accepted ballots are fsynced to VOTE_JOURNAL_PATH and a background
+#            committer moves them into Votes in batches (group commit)
+VOTE_INGESTION = 'direct'
+VOTE_JOURNAL_PATH = os.path.join(BASE_DIR, 'vote_journal.sqlite3')
+VOTE_JOURNAL_BATCH_SIZE = 200
+VOTE_JOURNAL_INTERVAL = 0.2  # Seconds the committer waits when the journal is empty
+
+# Live tally
+# Path of a memory-mapped counter file shared by the workers on this node
+# (e.g. '/dev/shm/e_voting_tally'); None reads tallies from the database
+LIVE_TALLY_PATH = None
+
+# Live results stream (Server-Sent Events, needs the ASGI entry point)
+LIVE_RESULTS_INTERVAL = 2  # Seconds between tally computations per worker
+
+# Result PDFs, cached per results revision and rendered in a process pool
+RESULTS_PDF_DIR = os.path.join(BASE_DIR, 'results_pdf')
+RESULTS_PDF_WORKERS = 1
+
+# Login admission control: password hashing is CPU bound, so only
+# LOGIN_HASH_SLOTS logins per node hash at once and at most
+# LOGIN_QUEUE_LENGTH more wait (up to LOGIN_QUEUE_TIMEOUT seconds) for a
+# slot. Any further login gets a 503 with Retry-After straight away.
+LOGIN_HASH_SLOTS = max(1, (os.cpu_count() or 2) // 2)
+LOGIN_QUEUE_LENGTH = 16
+LOGIN_QUEUE_TIMEOUT = 3
+LOGIN_ADMISSION_DIR = os.path.join(tempfile.gettempdir(), 'e_voting_login')  # Node-local
+
+# Password hashing policy: the first hasher hashes new and rehashed
+# passwords, the others only verify existing hashes. Pick the costs with
+# `python manage.py calibrate_hashers --target-ms 250`.
+PASSWORD_HASHERS = [
+    'account.hashers.ConfiguredPBKDF2PasswordHasher',
+    'account.hashers.ConfiguredScryptPasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+]
+PASSWORD_PBKDF2_ITERATIONS = 1000000
+PASSWORD_SCRYPT_WORK_FACTOR = 2 ** 14
+PASSWORD_SCRYPT_BLOCK_SIZE = 8
+PASSWORD_SCRYPT_PARALLELISM = 1
+
+# OTP SMS delivery (voting/sms.py), in a background thread per worker
+# 'voting.sms.FakeProvider' only logs messages, for tests and load runs
+SMS_PROVIDER = 'voting.sms.MultitexterProvider'
+SMS_TIMEOUT = (3.05, 10)  # Connect and read timeouts, in seconds
+SMS_WORKERS = 4  # Concurrent sends, and pooled connections
+SMS_BATCH_SIZE = 50
+SMS_MAX_ATTEMPTS = 4
+SMS_BACKOFF = 1  # Seconds before the first retry, doubled for each next one
+
+# One-time passwords (voting/otp.py), kept in a cache shared by the workers
+# whose MAX_ENTRIES is far above the electorate
+OTP_CACHE = 'otp'
+OTP_TTL = 60 * 10  # Seconds a code stays valid
+OTP_LENGTH = 6
+OTP_MAX_ATTEMPTS = 5  # Wrong guesses before a code is discarded
+
+# Rate limits per URL name: at most `requests` per `seconds`, counted per
+# client IP and per account (the posted email for login, else the logged-in
+# user). Buckets are shared by the workers of a node through RATE_LIMIT_PATH.
+# IP limits are generous: a campus NAT puts many voters behind one address.
+RATE_LIMITS = {
+    'account_login': {'ip': (300, 60), 'account': (10, 300), 'methods': ['POST']},
+    'resend_otp': {'ip': (120, 60), 'account': (5, 300)},
+    'preview_vote': {'ip': (600, 60), 'account': (30, 60)},
+    'submit_ballot': {'ip': (300, 60), 'account': (5, 60)},
+    # Caps OTP guesses per voter, however many are sent at once
+    'verify_otp': {'ip': (300, 60), 'account': (OTP_MAX_ATTEMPTS, OTP_TTL), 'methods': ['POST']},
+}
+RATE_LIMIT_PATH = os.path.join(tempfile.gettempdir(), 'e_voting_ratelimit.sqlite3')  # Node-local
+RATE_LIMIT_IP_HEADER = None  # e.g. 'HTTP_X_FORWARDED_FOR' behind a proxy that sets it
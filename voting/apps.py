@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class VotingConfig(AppConfig):
     name = 'voting'
+
+    def ready(self):
+        from . import signals  # noqa: F401
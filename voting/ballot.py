@@ -0,0 +1,255 @@
+from collections import namedtuple
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils.text import slugify
+
+from . import live_tally
+from .write_gate import write_gate
+from .models import Position, Voter, Votes, CandidateTally
+
+BALLOT_REVISION_KEY = 'ballot:revision'
+RESULTS_REVISION_KEY = 'results:revision'
+BALLOT_HTML_KEY = 'ballot:html:{revision}:{controls}'
+
+# Ballot HTML already built by this worker, keyed by (revision, display_controls)
+_rendered = {}
+# BallotSnapshot already built by this worker, keyed by revision
+_snapshots = {}
+
+BallotPosition = namedtuple(
+    'BallotPosition', ['id', 'name', 'slug', 'max_vote', 'priority', 'candidates'])
+BallotCandidate = namedtuple(
+    'BallotCandidate', ['id', 'fullname', 'bio', 'photo', 'position_id'])
+
+
+class BallotSnapshot(namedtuple('BallotSnapshot', ['revision', 'positions', 'by_slug', 'candidates'])):
+    """Immutable picture of the ballot for one revision.
+    positions: BallotPosition tuple ordered by priority
+    by_slug: form field name (slugified position name) -> BallotPosition
+    candidates: candidate id -> BallotCandidate
+    """
+    __slots__ = ()
+
+    def read_selections(self, form):
+        """Validate a submitted ballot form against this snapshot.
+        Returns (selections, error) where selections is a list of
+        (BallotPosition, [BallotCandidate, ...]) in ballot order.
+        """
+        selections = []
+        for position in self.positions:
+            if position.max_vote > 1:
+                form_position = form.get(position.slug + "[]")
+                if form_position is None:
+                    continue
+                if len(form_position) > position.max_vote:
+                    return [], "You can only choose " + \
+                        str(position.max_vote) + " candidates for " + position.name
+            else:
+                # Max Vote == 1
+                form_position = form.get(position.slug)
+                if form_position is None:
+                    continue
+                form_position = form_position[:1]
+            chosen = []
+            for form_candidate_id in form_position:
+                candidate = self.get_candidate(form_candidate_id, position)
+                if candidate is None or candidate in chosen:
+                    return [], "Please, browse the system properly"
+                chosen.append(candidate)
+            selections.append((position, chosen))
+        return selections, None
+
+    def get_candidate(self, candidate_id, position):
+        try:
+            candidate = self.candidates.get(int(candidate_id))
+        except (TypeError, ValueError):
+            return None
+        if candidate is None or candidate.position_id != position.id:
+            return None
+        return candidate
+
+
+def build_snapshot(revision=None):
+    positions = []
+    candidates = {}
+    queryset = Position.objects.order_by(
+        'priority').prefetch_related('candidate_set')
+    for position in queryset:
+        position_candidates = tuple(
+            BallotCandidate(candidate.id, candidate.fullname, candidate.bio,
+                            str(candidate.photo), position.id)
+            for candidate in position.candidate_set.all())
+        for candidate in position_candidates:
+            candidates[candidate.id] = candidate
+        positions.append(BallotPosition(
+            position.id, position.name, slugify(position.name),
+            position.max_vote, position.priority, position_candidates))
+    by_slug = {position.slug: position for position in positions}
+    return BallotSnapshot(revision, tuple(positions), by_slug, candidates)
+
+
+def get_snapshot():
+    """The BallotSnapshot of the current ballot revision"""
+    revision = ballot_revision()
+    snapshot = _snapshots.get(revision)
+    if snapshot is None:
+        snapshot = build_snapshot(revision)
+        _snapshots.clear()
+        _snapshots[revision] = snapshot
+    return snapshot
+
+
+def record_ballot(voter_id, selections):
+    """Write a validated ballot in one transaction: claim the voter (mark
+    them as voted), bulk insert every Votes row and bump the candidate
+    counters.
+    Returns False (writing nothing) if the voter has voted already.
+    """
+    try:
+        with write_gate(), transaction.atomic():
+            # A conditional update both checks and claims: 0 rows, voted already
+            if not Voter.objects.filter(id=voter_id, voted=False).update(voted=True):
+                return False
+            votes = [
+                Votes(voter_id=voter_id, position_id=position.id,
+                      candidate_id=candidate.id)
+                for position, candidates in selections
+                for candidate in candidates
+            ]
+            Votes.objects.bulk_create(votes)
+            CandidateTally.objects.add_votes([vote.candidate_id for vote in votes])
+            live_tally.add_votes_on_commit(vote.candidate_id for vote in votes)
+            bump_results_revision_on_commit()
+    except IntegrityError:
+        # votes_voter_candidate_unique: rows of this voter exist already
+        return False
+    return True
+
+
+def ballot_revision():
+    """The revision changes whenever a Position or Candidate changes.
+    It is a random token (not a counter) so a cleared cache can never
+    bring back a revision that a worker still holds HTML for.
+    """
+    revision = cache.get(BALLOT_REVISION_KEY)
+    if revision is None:
+        cache.add(BALLOT_REVISION_KEY, uuid4().hex, timeout=None)
+        revision = cache.get(BALLOT_REVISION_KEY)
+    return revision
+
+
+def bump_ballot_revision():
+    cache.set(BALLOT_REVISION_KEY, uuid4().hex, timeout=None)
+
+
+def bump_ballot_revision_on_commit():
+    transaction.on_commit(bump_ballot_revision)
+
+
+def results_revision():
+    """Like ballot_revision(), but changes whenever votes are recorded or removed"""
+    revision = cache.get(RESULTS_REVISION_KEY)
+    if revision is None:
+        cache.add(RESULTS_REVISION_KEY, uuid4().hex, timeout=None)
+        revision = cache.get(RESULTS_REVISION_KEY)
+    return revision
+
+
+def bump_results_revision_on_commit():
+    transaction.on_commit(
+        lambda: cache.set(RESULTS_REVISION_KEY, uuid4().hex, timeout=None))
+
+
+def renumber_positions():
+    """Close the gaps left in position priorities (e.g. after a delete)"""
+    positions = Position.objects.order_by('priority', 'id').only('id', 'priority')
+    for num, position in enumerate(positions, start=1):
+        if position.priority != num:
+            Position.objects.filter(id=position.id).update(priority=num)
+    bump_ballot_revision_on_commit()
+
+
+def get_ballot(display_controls=False):
+    """Return the ballot HTML for the current revision.
+    Served from this worker's memory first, then from the shared cache,
+    and only built from the database once per revision.
+    """
+    revision = ballot_revision()
+    key = (revision, display_controls)
+    output = _rendered.get(key)
+    if output is not None:
+        return output
+    shared_key = BALLOT_HTML_KEY.format(
+        revision=revision, controls=int(display_controls))
+    output = cache.get(shared_key)
+    if output is None:
+        output = render_ballot(get_snapshot(), display_controls)
+        cache.set(shared_key, output, timeout=None)
+    # Drop whatever belongs to older revisions
+    for old_key in [k for k in _rendered if k[0] != revision]:
+        del _rendered[old_key]
+    _rendered[key] = output
+    return output
+
+
+def render_ballot(snapshot, display_controls=False):
+    positions = snapshot.positions
+    output = ""
+    candidates_data = ""
+    for num, position in enumerate(positions, start=1):
+        name = position.name
+        position_name = position.slug
+        if position.max_vote > 1:
+            instruction = "You may select up to " + \
+                str(position.max_vote) + " candidates"
+        else:
+            instruction = "Select only one candidate"
+        for candidate in position.candidates:
+            if position.max_vote > 1:
+                input_box = '<input type="checkbox" value="'+str(candidate.id)+'" class="flat-red ' + \
+                    position_name+'" name="' + \
+                    position_name+"[]" + '">'
+            else:
+                input_box = '<input value="'+str(candidate.id)+'" type="radio" class="flat-red ' + \
+                    position_name+'" name="'+position_name+'">'
+            image = "/media/" + candidate.photo
+            candidates_data = candidates_data + '<li>' + input_box + '<button type="button" class="btn btn-primary btn-sm btn-flat clist platform" data-fullname="'+candidate.fullname+'" data-bio="'+candidate.bio+'"><i class="fa fa-search"></i> Platform</button><img src="' + \
+                image+'" height="100px" width="100px" class="clist"><span class="cname clist">' + \
+                candidate.fullname+'</span></li>'
+        up = ''
+        if num == 1:
+            up = 'disabled'
+        down = ''
+        if num == len(positions):
+            down = 'disabled'
+        output = output + f"""<div class="row">	<div class="col-xs-12"><div class="box box-solid" id="{position.id}">
+             <div class="box-header with-border">
+            <h3 class="box-title"><b>{name}</b></h3>"""
+
+        if display_controls:
+            output = output + f""" <div class="pull-right box-tools">
+        <button type="button" class="btn btn-default btn-sm moveup" data-id="{position.id}" {up}><i class="fa fa-arrow-up"></i> </button>
+        <button type="button" class="btn btn-default btn-sm movedown" data-id="{position.id}" {down}><i class="fa fa-arrow-down"></i></button>
+        </div>"""
+
+        output = output + f"""</div>
+        <div class="box-body">
+        <p>{instruction}
+        <span class="pull-right">
+        <button type="button" class="btn btn-success btn-sm btn-flat reset" data-desc="{position_name}"><i class="fa fa-refresh"></i> Reset</button>
+        </span>
+        </p>
+        <div id="candidate_list">
+        <ul>
+        {candidates_data}
+        </ul>
+        </div>
+        </div>
+        </div>
+        </div>
+        </div>
+        """
+        candidates_data = ''
+    return output
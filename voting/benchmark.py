@@ -0,0 +1,102 @@
+"""Helpers shared by the benchmark_* management commands.
+They run against a throwaway database, never the election's own one.
+"""
+import os
+import random
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.db import connections, OperationalError
+
+from account.models import CustomUser
+from .models import Position, Candidate, Voter
+
+
+@contextmanager
+def scratch_database():
+    """Point the default connection at a fresh, migrated, file-backed
+    database (file-backed so that worker threads share it) for the
+    duration of the block.
+    """
+    connection = connections['default']
+    tmpdir = tempfile.mkdtemp(prefix='e_voting_bench_')
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    old_test_name = test_settings.get('NAME')
+    test_settings['NAME'] = os.path.join(tmpdir, 'bench.sqlite3')
+    old_name = connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield tmpdir
+    finally:
+        connections.close_all()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        test_settings['NAME'] = old_test_name
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def seed_election(positions=5, candidates=4, voters=100, max_vote=1):
+    """Bulk create an election; returns the list of voter ids"""
+    Position.objects.bulk_create([
+        Position(name="Position %d" % num, max_vote=max_vote, priority=num)
+        for num in range(1, positions + 1)
+    ])
+    Candidate.objects.bulk_create([
+        Candidate(fullname="Candidate %d-%d" % (position.id, num),
+                  bio="", photo="candidates/bench.jpg", position=position)
+        for position in Position.objects.all()
+        for num in range(1, candidates + 1)
+    ])
+    CustomUser.objects.bulk_create([
+        # '!' is an unusable password, so seeding does not pay for hashing
+        CustomUser(email="voter%d@bench.local" % num, password="!",
+                   first_name="Voter", last_name=str(num))
+        for num in range(voters)
+    ], batch_size=500)
+    Voter.objects.bulk_create([
+        Voter(admin_id=user_id, phone="%011d" % user_id, verified=True)
+        for user_id in CustomUser.objects.values_list('id', flat=True)
+    ], batch_size=500)
+    return list(Voter.objects.values_list('id', flat=True))
+
+
+def random_selections(snapshot, rng=random):
+    """A valid ballot for the given BallotSnapshot"""
+    return [
+        (position, rng.sample(position.candidates,
+                              min(position.max_vote, len(position.candidates))))
+        for position in snapshot.positions if position.candidates
+    ]
+
+
+class Stopwatch:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.elapsed = None
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+
+
+def submit_concurrently(submit, ballots, threads):
+    """Call submit(voter_id, selections) for every ballot from a pool of
+    threads, each like a request on its own connection.
+    Returns (seconds elapsed, number of OperationalErrors).
+    """
+    errors = []
+
+    def one(ballot):
+        try:
+            submit(*ballot)
+        except OperationalError as e:  # e.g. "database is locked"
+            errors.append(e)
+        finally:
+            connections['default'].close()  # Like the end of a request
+
+    with Stopwatch() as watch:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(one, ballots))
+    return watch.elapsed, len(errors)
@@ -1,13 +1,9 @@
-from django.conf import settings
+from . import election
 
 
 def ElectionTitle(request):
-    context = {}
-    title = "No Title Yet"
-    try:
-        file = open(settings.ELECTION_TITLE_PATH, 'r')
-        title = file.read()
-    except:
-        pass
-    context['TITLE'] = title
-    return context
+    snapshot = election.current()
+    return {
+        'TITLE': snapshot.title,
+        'ELECTION': snapshot,
+    }
@@ -0,0 +1,79 @@
+"""Election-wide settings: title, OTP mode and voting window
+
+They live in the single ElectionSettings row and each process keeps an
+immutable snapshot of it. Saving the row bumps a version stamp in the
+shared cache; a process compares its snapshot against the stamp at most
+once every ELECTION_SETTINGS_TTL seconds, so in steady state reading the
+settings (e.g. the title on every page) costs no file or database I/O.
+"""
+import time
+from collections import namedtuple
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.formats import date_format
+
+from .models import ElectionSettings
+
+VERSION_KEY = 'election_settings:version'
+
+_snapshot = None
+_checked_at = 0.0
+
+
+class Election(namedtuple('Election', [
+        'version', 'title', 'otp_mode', 'voting_opens', 'voting_closes'])):
+    @property
+    def sends_otp(self):
+        return self.otp_mode == ElectionSettings.OTP_SMS
+
+    def closed_message(self, now=None):
+        """Why voters cannot vote right now, or None while voting is open"""
+        now = now or timezone.now()
+        if self.voting_opens and now < self.voting_opens:
+            return "Voting opens on " + date_format(
+                timezone.localtime(self.voting_opens), 'DATETIME_FORMAT')
+        if self.voting_closes and now >= self.voting_closes:
+            return "Voting has closed"
+        return None
+
+
+def current():
+    """This process' snapshot of the settings, reloaded when stale"""
+    global _snapshot, _checked_at
+    now = time.monotonic()
+    snapshot = _snapshot
+    if snapshot is not None and now - _checked_at < settings.ELECTION_SETTINGS_TTL:
+        return snapshot
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid4().hex, timeout=None)
+        version = cache.get(VERSION_KEY)
+    if snapshot is None or snapshot.version != version:
+        # The stamp is read before the row: a save in between only makes
+        # the next check reload once more
+        row = ElectionSettings.load()
+        snapshot = Election(version, row.title, row.otp_mode,
+                            row.voting_opens, row.voting_closes)
+    _snapshot, _checked_at = snapshot, now
+    return snapshot
+
+
+def bump_version_on_commit():
+    def bump():
+        global _snapshot
+        cache.set(VERSION_KEY, uuid4().hex, timeout=None)
+        _snapshot = None  # This process sees its own change at once
+    transaction.on_commit(bump)
+
+
+def update(**fields):
+    """Change some settings; raises ValidationError for invalid values"""
+    row = ElectionSettings.load()
+    for name, value in fields.items():
+        setattr(row, name, value)
+    row.full_clean()
+    row.save()
@@ -0,0 +1,217 @@
+"""Group-commit vote ingestion
+
+With VOTE_INGESTION = 'journal' an accepted ballot is appended to a small
+SQLite journal (WAL, synchronous=FULL, so the append is fsynced before the
+voter gets a receipt) instead of being written to Votes inside the request.
+A background committer in each worker drains the journal into Votes in
+batches, one transaction per batch. Only one committer on the node drains
+at a time (flock on a lock file next to the journal).
+
+Replaying the journal never duplicates votes: a journaled ballot is only
+applied if the voter is not already marked as voted, and the Votes rows and
+the voted flag are written in the same transaction. Entries of a voter
+deleted since, and votes for a candidate deleted since, are dropped as
+the direct path's cascades would have dropped them.
+"""
+import fcntl
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from . import live_tally
+from .write_gate import write_gate
+from .ballot import bump_results_revision_on_commit
+from .models import Candidate, Voter, Votes, CandidateTally
+
+logger = logging.getLogger(__name__)
+_local = threading.local()
+_committer = None
+_committer_lock = threading.Lock()
+
+
+def is_enabled():
+    return getattr(settings, 'VOTE_INGESTION', 'direct') == 'journal'
+
+
+def _connection():
+    path = str(settings.VOTE_JOURNAL_PATH)
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=FULL")
+        conn.execute("""CREATE TABLE IF NOT EXISTS ballots (
+            voter_id INTEGER PRIMARY KEY,
+            selections TEXT NOT NULL,
+            accepted_at REAL NOT NULL,
+            applied INTEGER NOT NULL DEFAULT 0)""")
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS ballots_pending ON ballots (applied)")
+        connections[path] = conn
+    return conn
+
+
+def append(voter_id, selections):
+    """Durably accept a validated ballot.
+    Returns False if this voter already has a ballot in the journal.
+    """
+    rows = [[position.id, candidate.id]
+            for position, candidates in selections
+            for candidate in candidates]
+    try:
+        _connection().execute(
+            "INSERT INTO ballots (voter_id, selections, accepted_at) VALUES (?, ?, ?)",
+            (voter_id, json.dumps(rows), time.time()))
+    except sqlite3.IntegrityError:
+        return False
+    ensure_committer()
+    return True
+
+
+def contains(voter_id):
+    """Has this voter's ballot been accepted (applied or not)?"""
+    ensure_committer()
+    row = _connection().execute(
+        "SELECT 1 FROM ballots WHERE voter_id = ?", (voter_id,)).fetchone()
+    return row is not None
+
+
+def has_voted(voter):
+    """voter.voted, also counting a ballot still waiting in the journal"""
+    return voter.voted or (is_enabled() and contains(voter.id))
+
+
+def pending_count():
+    row = _connection().execute(
+        "SELECT COUNT(*) FROM ballots WHERE applied = 0").fetchone()
+    return row[0]
+
+
+def drain(batch_size=None):
+    """Apply pending journal entries to Votes, one transaction per batch.
+    Returns how many ballots were applied, or None if another committer on
+    this node holds the drain lock.
+    """
+    batch_size = batch_size or settings.VOTE_JOURNAL_BATCH_SIZE
+    with open(str(settings.VOTE_JOURNAL_PATH) + '.lock', 'w') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return None
+        applied = 0
+        while True:
+            count = _apply_batch(batch_size)
+            if count == 0:
+                break
+            applied += count
+        return applied
+
+
+def _apply_batch(batch_size):
+    conn = _connection()
+    pending = conn.execute(
+        "SELECT voter_id, selections FROM ballots WHERE applied = 0 "
+        "ORDER BY accepted_at LIMIT ?", (batch_size,)).fetchall()
+    if not pending:
+        return 0
+    voter_ids = [voter_id for voter_id, _ in pending]
+    entries = [(voter_id, json.loads(rows)) for voter_id, rows in pending]
+    with write_gate(), transaction.atomic():
+        # Replayed entries whose voter is already marked were applied before
+        voted = dict(Voter.objects.select_for_update().filter(
+            id__in=voter_ids).values_list('id', 'voted'))
+        candidate_ids = set(Candidate.objects.filter(id__in={
+            candidate_id for _, rows in entries for _, candidate_id in rows
+        }).values_list('id', flat=True))
+        fresh = []
+        for voter_id, rows in entries:
+            if voter_id not in voted:
+                logger.warning("Dropping the journaled ballot of deleted voter %s", voter_id)
+            elif not voted[voter_id]:
+                fresh.append((voter_id, [row for row in rows if row[1] in candidate_ids]))
+        votes = [
+            Votes(voter_id=voter_id, position_id=position_id,
+                  candidate_id=candidate_id)
+            for voter_id, rows in fresh
+            for position_id, candidate_id in rows
+        ]
+        Votes.objects.bulk_create(votes)
+        CandidateTally.objects.add_votes([vote.candidate_id for vote in votes])
+        live_tally.add_votes_on_commit(vote.candidate_id for vote in votes)
+        bump_results_revision_on_commit()
+        Voter.objects.filter(
+            id__in=[voter_id for voter_id, _ in fresh]).update(voted=True)
+    conn.executemany(
+        "UPDATE ballots SET applied = 1 WHERE voter_id = ?",
+        [(voter_id,) for voter_id in voter_ids])
+    return len(pending)
+
+
+def reset():
+    """Forget every journaled ballot (used when all votes are reset)"""
+    if is_enabled() or os.path.exists(settings.VOTE_JOURNAL_PATH):
+        _connection().execute("DELETE FROM ballots")
+
+
+def forget_voter(voter_id):
+    """Drop a deleted voter's ballot from the journal"""
+    if is_enabled() or os.path.exists(settings.VOTE_JOURNAL_PATH):
+        _connection().execute("DELETE FROM ballots WHERE voter_id = ?", (voter_id,))
+
+
+def forget_candidates(candidate_ids):
+    """Drop the pending votes for deleted candidates from the journal"""
+    if not (is_enabled() or os.path.exists(settings.VOTE_JOURNAL_PATH)):
+        return
+    candidate_ids = set(candidate_ids)
+    conn = _connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        pending = conn.execute(
+            "SELECT voter_id, selections FROM ballots WHERE applied = 0").fetchall()
+        changed = []
+        for voter_id, selections in pending:
+            rows = json.loads(selections)
+            kept = [row for row in rows if row[1] not in candidate_ids]
+            if len(kept) != len(rows):
+                changed.append((json.dumps(kept), voter_id))
+        conn.executemany(
+            "UPDATE ballots SET selections = ? WHERE voter_id = ?", changed)
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _run_committer():
+    while True:
+        try:
+            applied = drain()
+        except Exception:
+            logger.exception("Applying the vote journal failed")
+            applied = None  # Leave the entries pending and try again
+        if not applied:
+            time.sleep(settings.VOTE_JOURNAL_INTERVAL)
+
+
+def ensure_committer():
+    """Start this worker's background committer if it is not running.
+    The first pass replays whatever an earlier (crashed) process left.
+    """
+    global _committer
+    if _committer is not None and _committer.is_alive():
+        return
+    with _committer_lock:
+        if _committer is None or not _committer.is_alive():
+            _committer = threading.Thread(
+                target=_run_committer, name='vote-journal-committer', daemon=True)
+            _committer.start()
@@ -0,0 +1,160 @@
+"""Live vote counters shared by every gunicorn worker on the node
+
+Enabled by pointing LIVE_TALLY_PATH at a file (ideally on tmpfs, e.g.
+/dev/shm). The file is a small header followed by one signed 64 bit
+counter per candidate slot, the slot being the candidate id. Workers
+memory-map it; increments happen under an exclusive lockf() on the file
+and reads under a shared one, so they are atomic across processes.
+
+The header carries a stamp that must equal the one kept in the shared
+cache. A missing file, a missing stamp (e.g. after invalidate()) or a
+candidate id beyond the file's capacity makes the next read rebuild the
+counters from Votes. A rebuild counts inside the write gate and the
+exclusive file lock: no ballot can commit meanwhile, and every ballot
+committed before has already bumped the counters (add_votes runs on
+commit, before the writer leaves the gate), so none is lost or counted
+twice.
+"""
+import fcntl
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import CandidateTally
+from .write_gate import write_gate
+
+MAGIC = b'EVT1'
+HEADER = struct.Struct('<4sI32s')  # magic, capacity, stamp
+SLOT = struct.Struct('<q')
+STAMP_KEY = 'live_tally:stamp'
+
+_lock = threading.Lock()
+_mapped = {}  # path -> (file, mmap)
+
+
+def is_enabled():
+    return bool(getattr(settings, 'LIVE_TALLY_PATH', None))
+
+
+def _mapping():
+    """This process' (file, mmap) of the counter file, remapped whenever
+    another worker has grown the file.
+    """
+    path = settings.LIVE_TALLY_PATH
+    file, mm = _mapped.get(path, (None, None))
+    if file is None:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        file = os.fdopen(fd, 'r+b')
+    size = os.fstat(file.fileno()).st_size
+    if size < HEADER.size:
+        file.truncate(HEADER.size)
+        size = HEADER.size
+    if mm is None or len(mm) != size:
+        if mm is not None:
+            mm.close()
+        mm = mmap.mmap(file.fileno(), size)
+    _mapped[path] = (file, mm)
+    return file, mm
+
+
+@contextmanager
+def _locked(exclusive):
+    with _lock:
+        file, _ = _mapping()
+        fcntl.lockf(file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            # Map again under the lock: the file may have grown meanwhile
+            yield _mapping()[1]
+        finally:
+            fcntl.lockf(file, fcntl.LOCK_UN)
+
+
+def _is_current(mm, stamp):
+    magic, capacity, file_stamp = HEADER.unpack_from(mm, 0)
+    return (magic == MAGIC and stamp is not None
+            and file_stamp == stamp.encode()
+            and len(mm) >= HEADER.size + capacity * SLOT.size)
+
+
+def _capacity(mm):
+    return HEADER.unpack_from(mm, 0)[1]
+
+
+def rebuild():
+    """Recount every slot from Votes and stamp the file as current"""
+    stamp = uuid4().hex
+    with write_gate(), _lock:
+        file, _ = _mapping()
+        fcntl.lockf(file, fcntl.LOCK_EX)
+        try:
+            counts = CandidateTally.objects.counted_from_votes()
+            capacity = 64
+            while capacity <= max(counts, default=0):
+                capacity *= 2
+            # Only ever grow the file: other workers still map the old size
+            size = HEADER.size + capacity * SLOT.size
+            if os.fstat(file.fileno()).st_size < size:
+                file.truncate(size)
+            mm = _mapping()[1]
+            capacity = (len(mm) - HEADER.size) // SLOT.size
+            mm[HEADER.size:] = bytes(len(mm) - HEADER.size)
+            for candidate_id, count in counts.items():
+                SLOT.pack_into(mm, HEADER.size + candidate_id * SLOT.size, count)
+            HEADER.pack_into(mm, 0, MAGIC, capacity, stamp.encode())
+            cache.set(STAMP_KEY, stamp, timeout=None)
+        finally:
+            fcntl.lockf(file, fcntl.LOCK_UN)
+
+
+def invalidate():
+    """Make the next access rebuild the counters (after resets/deletes)"""
+    if is_enabled():
+        transaction.on_commit(lambda: cache.delete(STAMP_KEY))
+
+
+def add_votes(candidate_ids):
+    """Bump the counters for votes that have just been committed. Counters
+    that are not current are left alone: the rebuild at the next read
+    counts these votes from Votes (and cannot run here, inside the gate).
+    """
+    candidate_ids = list(candidate_ids)
+    with _locked(exclusive=True) as mm:
+        # Read under the lock: a rebuild that finished meanwhile restamped it
+        if not _is_current(mm, cache.get(STAMP_KEY)):
+            return
+        if max(candidate_ids, default=0) >= _capacity(mm):
+            cache.delete(STAMP_KEY)  # A new candidate: the file must grow
+            return
+        for candidate_id in candidate_ids:
+            offset = HEADER.size + candidate_id * SLOT.size
+            SLOT.pack_into(mm, offset, SLOT.unpack_from(mm, offset)[0] + 1)
+
+
+def add_votes_on_commit(candidate_ids):
+    if is_enabled():
+        candidate_ids = list(candidate_ids)
+        transaction.on_commit(lambda: add_votes(candidate_ids))
+
+
+def vote_counts():
+    """candidate id -> votes, read from shared memory without the database
+    (unless the counters have to be rebuilt)
+    """
+    if not _read_is_current():
+        rebuild()
+    with _locked(exclusive=False) as mm:
+        values = struct.unpack_from('<%dq' % _capacity(mm), mm, HEADER.size)
+    return {slot: count for slot, count in enumerate(values) if count}
+
+
+def _read_is_current():
+    stamp = cache.get(STAMP_KEY)
+    with _locked(exclusive=False) as mm:
+        return _is_current(mm, stamp)
@@ -0,0 +1,59 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from voting import journal
+from voting.ballot import build_snapshot, record_ballot
+from voting.benchmark import (scratch_database, seed_election, random_selections,
+                              submit_concurrently, Stopwatch)
+from voting.models import Voter, Votes, CandidateTally
+
+
+class Command(BaseCommand):
+    help = "Compare ballots/sec of the direct and the journal (group commit) ingestion paths"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--voters', type=int, default=1000)
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--positions', type=int, default=5)
+        parser.add_argument('--candidates', type=int, default=4)
+
+    def handle(self, *args, **options):
+        with scratch_database() as tmpdir:
+            voter_ids = seed_election(
+                options['positions'], options['candidates'], options['voters'])
+            snapshot = build_snapshot()
+            ballots = [(voter_id, random_selections(snapshot))
+                       for voter_id in voter_ids]
+
+            self.report("direct", *self.run(
+                record_ballot, ballots, options['threads']))
+
+            Votes.objects.all().delete()
+            CandidateTally.objects.reset()
+            Voter.objects.update(voted=False)
+            journal_path = os.path.join(tmpdir, 'journal.sqlite3')
+            with override_settings(VOTE_JOURNAL_PATH=journal_path,
+                                   VOTE_INGESTION='journal'):
+                accepted_in, errors = self.run(
+                    journal.append, ballots, options['threads'])
+                self.report("journal (accept)", accepted_in, errors)
+                with Stopwatch() as drained:
+                    while journal.pending_count():
+                        if journal.drain() is None:
+                            time.sleep(0.01)  # The background committer is on it
+                self.report("journal (accept + drain)",
+                            accepted_in + drained.elapsed, errors)
+            applied = Votes.objects.values('voter').distinct().count()
+            self.stdout.write("Voters with votes after drain: %d/%d" %
+                              (applied, len(ballots)))
+
+    def run(self, submit, ballots, threads):
+        self.ballots = len(ballots)
+        return submit_concurrently(submit, ballots, threads)
+
+    def report(self, label, elapsed, errors):
+        self.stdout.write("%-26s %8.1f ballots/sec  %5d errors  (%.2fs)" % (
+            label, self.ballots / elapsed, errors, elapsed))
@@ -0,0 +1,71 @@
+import multiprocessing
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test.utils import override_settings
+
+from voting.ballot import build_snapshot, record_ballot
+from voting.benchmark import (scratch_database, seed_election, random_selections,
+                              submit_concurrently, Stopwatch)
+from voting.models import Voter, Votes, CandidateTally
+
+
+class Command(BaseCommand):
+    help = "Compare submits/sec and lock errors of record_ballot with and without the SQLite profile"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--voters', type=int, default=1000)
+        parser.add_argument('--threads', type=int, default=16,
+                            help="Submitting threads per process")
+        parser.add_argument('--processes', type=int, default=1,
+                            help="Forked processes, like gunicorn workers")
+        parser.add_argument('--positions', type=int, default=5)
+        parser.add_argument('--candidates', type=int, default=4)
+
+    def handle(self, *args, **options):
+        profiles = [
+            # label, connection OPTIONS, journal mode, write gate
+            ("default SQLite", {}, 'DELETE', False),
+            ("profile", settings.SQLITE_OPTIONS, 'WAL', False),
+            ("profile + write gate", settings.SQLITE_OPTIONS, 'WAL', True),
+        ]
+        with scratch_database():
+            voter_ids = seed_election(
+                options['positions'], options['candidates'], options['voters'])
+            snapshot = build_snapshot()
+            ballots = [(voter_id, random_selections(snapshot))
+                       for voter_id in voter_ids]
+            settings_dict = connections['default'].settings_dict
+            for label, db_options, journal_mode, gate in profiles:
+                Votes.objects.all().delete()
+                CandidateTally.objects.reset()
+                Voter.objects.update(voted=False)
+                with connections['default'].cursor() as cursor:
+                    # The journal mode is stored in the file, not per connection
+                    cursor.execute("PRAGMA journal_mode=%s" % journal_mode)
+                connections.close_all()
+                settings_dict['OPTIONS'] = dict(db_options)
+                with override_settings(SQLITE_WRITE_GATE=gate):
+                    elapsed, errors = self.run(
+                        ballots, options['processes'], options['threads'])
+                recorded = Voter.objects.filter(voted=True).count()
+                self.stdout.write(
+                    "%-22s %8.1f submits/sec  %5d lock errors (%.1f%%)  %d/%d recorded" % (
+                        label, len(ballots) / elapsed, errors,
+                        100.0 * errors / len(ballots), recorded, len(ballots)))
+
+    def run(self, ballots, processes, threads):
+        if processes == 1:
+            return submit_concurrently(record_ballot, ballots, threads)
+        # Forked children inherit the settings above; each gets a slice
+        context = multiprocessing.get_context('fork')
+        with context.Pool(processes) as pool, Stopwatch() as watch:
+            results = pool.starmap(_submit_slice, [
+                (ballots[index::processes], threads) for index in range(processes)])
+        return watch.elapsed, sum(errors for _, errors in results)
+
+
+def _submit_slice(ballots, threads):
+    connections.close_all()  # Never share the parent's SQLite handle
+    return submit_concurrently(record_ballot, ballots, threads)
@@ -0,0 +1,74 @@
+import random
+
+from django.core.management.base import BaseCommand
+
+from voting.ballot import BallotPosition, BallotCandidate
+from voting.benchmark import Stopwatch
+from voting.tabulation import count_votes, tabulate
+
+
+def legacy_find_n_winners(data, n):
+    """The former PrintView ranking (copy, then max() + remove() n times)"""
+    final_list = []
+    candidate_data = data[:]
+    for i in range(0, n):
+        if len(candidate_data) == 0:
+            continue
+        this_winner = max(candidate_data, key=lambda x: x['votes'])
+        final_list.append(this_winner['name'] + " with " +
+                          str(this_winner['votes']) + " votes")
+        candidate_data.remove(this_winner)
+    return ", &nbsp;".join(final_list)
+
+
+class Command(BaseCommand):
+    help = "Time the tabulation engine against the former per-position ranking"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--votes', type=int, default=1000000)
+        parser.add_argument('--candidates', type=int, default=1000)
+        parser.add_argument('--positions', type=int, default=50)
+        parser.add_argument('--max-vote', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=2024)
+        parser.add_argument('--repeat', type=int, default=5,
+                            help="Report the best of this many runs")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        per_position = options['candidates'] // options['positions']
+        positions = []
+        candidate_id = 0
+        for position_id in range(1, options['positions'] + 1):
+            candidates = []
+            for _ in range(per_position):
+                candidate_id += 1
+                candidates.append(BallotCandidate(
+                    candidate_id, "Candidate %d" % candidate_id, "", "", position_id))
+            positions.append(BallotPosition(
+                position_id, "Position %d" % position_id, "position-%d" % position_id,
+                options['max_vote'], position_id, tuple(candidates)))
+        votes = rng.choices(range(1, candidate_id + 1), k=options['votes'])
+        self.stdout.write("%d votes, %d candidates, %d positions, max_vote %d" % (
+            len(votes), candidate_id, len(positions), options['max_vote']))
+
+        counts = count_votes(votes)
+        self.report("count votes", lambda: count_votes(votes), options['repeat'])
+        self.report("rank (tabulation engine)",
+                    lambda: tabulate(positions, counts), options['repeat'])
+
+        def legacy():
+            for position in positions:
+                candidate_data = [
+                    {'name': candidate.fullname, 'votes': counts.get(candidate.id, 0)}
+                    for candidate in position.candidates
+                ]
+                legacy_find_n_winners(candidate_data, position.max_vote)
+        self.report("rank (former find_n_winners)", legacy, options['repeat'])
+
+    def report(self, label, run, repeat):
+        best = None
+        for _ in range(repeat):
+            with Stopwatch() as watch:
+                run()
+            best = watch.elapsed if best is None else min(best, watch.elapsed)
+        self.stdout.write("%-30s %9.2f ms" % (label, best * 1000))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from voting.query_plans import hot_queries, plan, unindexed_steps
+
+
+class Command(BaseCommand):
+    help = "EXPLAIN QUERY PLAN the hot Votes queries; fails if one scans the table or sorts"
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("Query plans are only checked on SQLite")
+        failures = []
+        for label, queryset in hot_queries():
+            steps = plan(queryset, connection)
+            self.stdout.write("%-40s %s" % (label, " | ".join(steps)))
+            if unindexed_steps(steps):
+                failures.append(label)
+        if failures:
+            raise CommandError("Not served by an index: " + ", ".join(failures))
+        self.stdout.write(self.style.SUCCESS("Every hot Votes query uses an index"))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from voting.voter_import import import_voters
+
+
+class Command(BaseCommand):
+    help = "Create voters in bulk from a CSV file (first_name, last_name, email, phone, password)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file')
+        parser.add_argument('--processes', type=int, default=None,
+                            help="Password hashing processes (default: one per CPU)")
+
+    def handle(self, *args, **options):
+        def progress(report):
+            self.stdout.write("%d created, %d rejected" %
+                              (report.created, len(report.errors)))
+
+        try:
+            with open(options['csv_file'], newline='', encoding='utf-8-sig') as lines:
+                report = import_voters(lines, options['processes'], progress)
+        except (OSError, ValueError) as error:
+            raise CommandError(error)
+        for line, message in report.errors:
+            self.stdout.write("Line %d: %s" % (line, message))
+        self.stdout.write(self.style.SUCCESS(
+            "%d voter(s) imported, %d row(s) rejected" %
+            (report.created, len(report.errors))))
@@ -0,0 +1,33 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from voting import replica
+
+
+class Command(BaseCommand):
+    help = "Copy the primary SQLite database to the read replica (REPLICA_DATABASE)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--every', type=float, default=0,
+                            help="Keep refreshing, every this many seconds")
+
+    def handle(self, *args, **options):
+        alias = getattr(settings, 'REPLICA_DATABASE', None)
+        if not alias:
+            raise CommandError("No replica configured (REPLICA_DATABASE)")
+        source = connections['default'].settings_dict
+        target = connections[alias].settings_dict
+        if not (source['ENGINE'].endswith('sqlite3') and target['ENGINE'].endswith('sqlite3')):
+            raise CommandError("Only a SQLite replica of a SQLite primary can be refreshed here")
+        while True:
+            started = time.monotonic()
+            replica.refresh(source['NAME'], target['NAME'])
+            took = time.monotonic() - started
+            self.stdout.write(self.style.SUCCESS(
+                "Replica %s refreshed in %.2fs" % (target['NAME'], took)))
+            if not options['every']:
+                return
+            time.sleep(max(0, options['every'] - took))
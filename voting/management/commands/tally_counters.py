@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from voting.models import CandidateTally
+
+
+class Command(BaseCommand):
+    help = "Verify the CandidateTally counters against Votes, or rebuild them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help="Recount every counter from Votes")
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            CandidateTally.objects.rebuild()
+            self.stdout.write(self.style.SUCCESS("Counters rebuilt from Votes"))
+            return
+        mismatches = CandidateTally.objects.mismatches()
+        for candidate_id, counter, counted in mismatches:
+            self.stdout.write("Candidate %s: counter %s, Votes %s" %
+                              (candidate_id, counter, counted))
+        if mismatches:
+            raise CommandError("%d counter(s) out of step; run with --rebuild" %
+                               len(mismatches))
+        self.stdout.write(self.style.SUCCESS("All counters match Votes"))
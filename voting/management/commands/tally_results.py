@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from voting.ballot import build_snapshot
+from voting.models import Votes, CandidateTally
+from voting.tabulation import count_votes, tabulate, summarize
+
+
+class Command(BaseCommand):
+    help = "Print the election result, counted from the Votes table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--counters', action='store_true',
+                            help="Use the CandidateTally counters instead of counting Votes")
+
+    def handle(self, *args, **options):
+        snapshot = build_snapshot()
+        if options['counters']:
+            counts = dict(CandidateTally.objects.values_list('candidate_id', 'count'))
+        else:
+            counts = count_votes(Votes.objects.values_list(
+                'candidate_id', flat=True).iterator(chunk_size=10000))
+        for result in tabulate(snapshot.positions, counts):
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                "%s (max %d)" % (result.position.name, result.position.max_vote)))
+            for ranked in result.ranking:
+                self.stdout.write("  %3d. %-40s %d" % (
+                    ranked.rank, ranked.candidate.fullname, ranked.votes))
+            self.stdout.write("  " + summarize(result))
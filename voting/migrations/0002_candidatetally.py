@@ -0,0 +1,37 @@
+# Generated by Django 5.2.6 on 2026-10-17 22:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_tallies(apps, schema_editor):
+    Candidate = apps.get_model('voting', 'Candidate')
+    CandidateTally = apps.get_model('voting', 'CandidateTally')
+    Votes = apps.get_model('voting', 'Votes')
+    counts = dict(Votes.objects.order_by().values('candidate_id').annotate(
+        votes=Count('id')).values_list('candidate_id', 'votes'))
+    CandidateTally.objects.bulk_create([
+        CandidateTally(candidate_id=candidate_id, position_id=position_id,
+                       count=counts.get(candidate_id, 0))
+        for candidate_id, position_id in Candidate.objects.values_list('id', 'position_id')
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CandidateTally',
+            fields=[
+                ('candidate', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='tally', serialize=False, to='voting.candidate')),
+                ('count', models.IntegerField(default=0)),
+                ('position', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='voting.position')),
+            ],
+        ),
+        migrations.RunPython(fill_tallies, migrations.RunPython.noop),
+    ]
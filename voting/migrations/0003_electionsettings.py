@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-17 22:33
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def import_settings(apps, schema_editor):
+    ElectionSettings = apps.get_model('voting', 'ElectionSettings')
+    title = "No Title Yet"
+    try:
+        with open(settings.ELECTION_TITLE_PATH, 'r') as file:
+            title = file.read().strip()[:200] or title
+    except (AttributeError, OSError):
+        pass
+    ElectionSettings.objects.create(
+        pk=1, title=title,
+        otp_mode='sms' if getattr(settings, 'SEND_OTP', False) else 'bypass')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0002_candidatetally'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ElectionSettings',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(default='No Title Yet', max_length=200)),
+                ('otp_mode', models.CharField(choices=[('sms', 'Send OTP by SMS'), ('bypass', 'No OTP')], default='bypass', max_length=10)),
+                ('voting_opens', models.DateTimeField(blank=True, null=True)),
+                ('voting_closes', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(import_settings, migrations.RunPython.noop),
+    ]
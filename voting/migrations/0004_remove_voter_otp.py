@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-17 22:35
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0003_electionsettings'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='voter',
+            name='otp',
+        ),
+    ]
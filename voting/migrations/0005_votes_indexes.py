@@ -0,0 +1,52 @@
+# Generated by Django 5.2.6 on 2026-10-17 22:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_votes(apps, schema_editor):
+    """Keep the first row of any (voter, candidate) pair recorded twice
+    so the unique constraint can be added, and recount those candidates
+    """
+    Votes = apps.get_model('voting', 'Votes')
+    CandidateTally = apps.get_model('voting', 'CandidateTally')
+    duplicates = Votes.objects.order_by().values('voter_id', 'candidate_id').annotate(
+        rows=Count('id'), first=Min('id')).filter(rows__gt=1)
+    candidates = set()
+    for duplicate in duplicates:
+        Votes.objects.filter(voter_id=duplicate['voter_id'],
+                             candidate_id=duplicate['candidate_id']).exclude(
+            id=duplicate['first']).delete()
+        candidates.add(duplicate['candidate_id'])
+    for candidate_id in candidates:
+        CandidateTally.objects.filter(candidate_id=candidate_id).update(
+            count=Votes.objects.filter(candidate_id=candidate_id).count())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0004_remove_voter_otp'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='votes',
+            name='voter',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='voting.voter'),
+        ),
+        migrations.AddIndex(
+            model_name='votes',
+            index=models.Index(fields=['voter', 'position'], name='votes_voter_position'),
+        ),
+        migrations.AddIndex(
+            model_name='votes',
+            index=models.Index(fields=['position', 'candidate'], name='votes_position_candidate'),
+        ),
+        migrations.RunPython(remove_duplicate_votes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='votes',
+            constraint=models.UniqueConstraint(fields=('voter', 'candidate'), name='votes_voter_candidate_unique'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-17 22:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('voting', '0005_votes_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='electionsettings',
+            name='otp_generation',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32),
+        ),
+    ]
@@ -1,4 +1,7 @@
-from django.db import models
+from collections import Counter
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import Count, F
 from account.models import CustomUser
 # Create your models here.
 
@@ -6,7 +9,6 @@ from account.models import CustomUser
 class Voter(models.Model):
     admin = models.OneToOneField(CustomUser, on_delete=models.CASCADE)
     phone = models.CharField(max_length=11, unique=True)  # Used for OTP
-    otp = models.CharField(max_length=10, null=True)
     verified = models.BooleanField(default=False)
     voted = models.BooleanField(default=False)
     otp_sent = models.IntegerField(default=0)  # Control how many OTPs are sent
@@ -15,6 +17,34 @@ class Voter(models.Model):
         return self.admin.last_name + ", " + self.admin.first_name
 
 
+class ElectionSettings(models.Model):
+    """The one row of election-wide settings; read it through voting.election"""
+    OTP_SMS = 'sms'
+    OTP_BYPASS = 'bypass'
+    OTP_MODES = [
+        (OTP_SMS, "Send OTP by SMS"),
+        (OTP_BYPASS, "No OTP"),
+    ]
+    title = models.CharField(max_length=200, default="No Title Yet")
+    otp_mode = models.CharField(max_length=10, choices=OTP_MODES, default=OTP_BYPASS)
+    voting_opens = models.DateTimeField(null=True, blank=True)  # None: open already
+    voting_closes = models.DateTimeField(null=True, blank=True)  # None: never closes
+    # OTPs are stored under this stamp; changing it voids every outstanding code
+    otp_generation = models.CharField(max_length=32, blank=True, default='', editable=False)
+
+    def clean(self):
+        if self.voting_opens and self.voting_closes and self.voting_closes <= self.voting_opens:
+            raise ValidationError("Voting must close after it opens")
+
+    @classmethod
+    def load(cls):
+        settings, _ = cls.objects.get_or_create(pk=1)
+        return settings
+
+    def __str__(self):
+        return self.title
+
+
 class Position(models.Model):
     name = models.CharField(max_length=50, unique=True)
     max_vote = models.IntegerField()
@@ -35,6 +65,95 @@ class Candidate(models.Model):
 
 
 class Votes(models.Model):
-    voter = models.ForeignKey(Voter, on_delete=models.CASCADE)
+    # Lookups by voter are served by the composite indexes below
+    voter = models.ForeignKey(Voter, on_delete=models.CASCADE, db_index=False)
     position = models.ForeignKey(Position, on_delete=models.CASCADE)
     candidate = models.ForeignKey(Candidate, on_delete=models.CASCADE)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['voter', 'position'], name='votes_voter_position'),
+            models.Index(fields=['position', 'candidate'], name='votes_position_candidate'),
+        ]
+        constraints = [
+            # A ballot can choose a candidate once (and its voter's ballot once)
+            models.UniqueConstraint(fields=['voter', 'candidate'], name='votes_voter_candidate_unique'),
+        ]
+
+
+class CandidateTallyManager(models.Manager):
+    def add_votes(self, candidate_ids):
+        """Increment the counters of the given candidate ids (one per vote).
+        Call inside the transaction that inserts the Votes rows.
+        """
+        self._change(candidate_ids, 1)
+
+    def remove_votes(self, candidate_ids):
+        """Decrement the counters of the given candidate ids (one per vote
+        about to be deleted)
+        """
+        self._change(candidate_ids, -1)
+
+    def _change(self, candidate_ids, sign):
+        by_increment = {}
+        for candidate_id, increment in Counter(candidate_ids).items():
+            by_increment.setdefault(sign * increment, []).append(candidate_id)
+        for increment, ids in by_increment.items():
+            updated = self.filter(candidate_id__in=ids).update(
+                count=F('count') + increment)
+            if updated < len(ids) and increment > 0:
+                # Counter rows are created with the candidate; this only
+                # covers candidates that predate the counters
+                existing = self.filter(candidate_id__in=ids).values_list(
+                    'candidate_id', flat=True)
+                self.bulk_create([
+                    CandidateTally(candidate_id=candidate_id,
+                                   position_id=position_id, count=increment)
+                    for candidate_id, position_id in Candidate.objects.filter(
+                        id__in=ids).exclude(id__in=existing).values_list('id', 'position_id')
+                ])
+
+    def reset(self):
+        self.update(count=0)
+
+    def counted_from_votes(self):
+        """candidate id -> votes, counted from the Votes table itself. Always
+        on the primary: the counts are stored as current, even when asked
+        from a view pinned to the read replica.
+        """
+        votes = Votes.objects.using('default').order_by()
+        return dict(votes.values('candidate_id').annotate(
+            votes=Count('id')).values_list('candidate_id', 'votes'))
+
+    def rebuild(self):
+        """Recount every counter from Votes"""
+        with transaction.atomic():
+            counts = self.counted_from_votes()
+            self.bulk_create([
+                CandidateTally(candidate_id=candidate_id, position_id=position_id,
+                               count=counts.get(candidate_id, 0))
+                for candidate_id, position_id in Candidate.objects.values_list('id', 'position_id')
+            ], update_conflicts=True, unique_fields=['candidate'],
+                update_fields=['position', 'count'])
+
+    def mismatches(self):
+        """[(candidate id, counter value, votes counted), ...] where they differ"""
+        counts = self.counted_from_votes()
+        tallies = dict(self.values_list('candidate_id', 'count'))
+        return [
+            (candidate_id, tallies.get(candidate_id), counts.get(candidate_id, 0))
+            for candidate_id in Candidate.objects.values_list('id', flat=True)
+            if tallies.get(candidate_id) != counts.get(candidate_id, 0)
+        ]
+
+
+class CandidateTally(models.Model):
+    """Materialized number of votes per candidate, kept in step with Votes"""
+    candidate = models.OneToOneField(
+        Candidate, on_delete=models.CASCADE, primary_key=True, related_name='tally')
+    position = models.ForeignKey(Position, on_delete=models.CASCADE)
+    count = models.IntegerField(default=0)
+    objects = CandidateTallyManager()
+
+    def __str__(self):
+        return str(self.candidate_id) + ": " + str(self.count)
@@ -0,0 +1,69 @@
+"""One-time passwords kept in an expiring store, not in the database
+
+Codes live in the OTP_CACHE cache for OTP_TTL seconds: a cache of their
+own, sized so it never culls (a culled code would be refused as invalid).
+A code allows OTP_MAX_ATTEMPTS guesses and is discarded once used; the
+guess counter is not atomic, so parallel guesses are bounded by the
+verify_otp entry of RATE_LIMITS. Keys carry the otp_generation stamp of
+the ElectionSettings row, which reset() changes to void every code; only
+that stamp and the voter's verified flag are written to the database.
+"""
+import secrets
+import time
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.crypto import constant_time_compare
+
+from .models import ElectionSettings
+
+
+def _cache():
+    return caches[settings.OTP_CACHE]
+
+
+def _key(voter_id):
+    # Read from the row, not the cached settings: a reset applies at once
+    return 'otp:%s:%s' % (ElectionSettings.load().otp_generation, voter_id)
+
+
+def generate_code():
+    return "".join(secrets.choice("123456789") for _ in range(settings.OTP_LENGTH))
+
+
+def issue(voter_id):
+    """This voter's current code, or a new one if it has none or it expired"""
+    key = _key(voter_id)
+    entry = _cache().get(key)
+    if entry is None:
+        entry = {'code': generate_code(), 'attempts': 0,
+                 'expires': time.time() + settings.OTP_TTL}
+        _cache().set(key, entry, timeout=settings.OTP_TTL)
+    return entry['code']
+
+
+def verify(voter_id, code):
+    """True if code is the voter's current one, which is then used up"""
+    key = _key(voter_id)
+    entry = _cache().get(key)
+    if entry is None or not code:
+        return False
+    if constant_time_compare(entry['code'], code):
+        _cache().delete(key)
+        return True
+    entry['attempts'] += 1
+    if entry['attempts'] >= settings.OTP_MAX_ATTEMPTS:
+        _cache().delete(key)
+    else:
+        # A wrong guess must not extend the code's life
+        remaining = entry['expires'] - time.time()
+        if remaining > 0:
+            _cache().set(key, entry, timeout=remaining)
+    return False
+
+
+def reset():
+    """Void every outstanding code (when the election is reset)"""
+    ElectionSettings.objects.filter(pk=ElectionSettings.load().pk).update(
+        otp_generation=uuid4().hex)
@@ -0,0 +1,45 @@
+"""EXPLAIN QUERY PLAN checks for the hot queries on voting_votes
+
+Every frequent Votes query must be served by an index: scanning a whole
+index is fine for a full count, scanning the table or sorting into a
+temp B-tree is not. Checked by the test suite and by
+`python manage.py check_query_plans` against a live database.
+"""
+from django.db.models import Count
+
+from .models import Votes
+
+
+def hot_queries():
+    """(label, queryset) for every frequent query on voting_votes"""
+    page = Votes.objects.order_by('id')
+    return [
+        ("ballot of a voter", Votes.objects.filter(voter_id=1)),
+        ("vote of a voter for a position", Votes.objects.filter(voter_id=1, position_id=1)),
+        ("candidates of a deleted voter",
+         Votes.objects.filter(voter_id=1).values_list('candidate_id', flat=True)),
+        ("votes per candidate", Votes.objects.order_by().values('candidate_id').annotate(
+            votes=Count('id'))),
+        ("votes per candidate of a position", Votes.objects.filter(position_id=1).order_by()
+         .values('candidate_id').annotate(votes=Count('id'))),
+        ("audit page", page.filter(id__gt=1)[:50]),
+        ("audit page by position", page.filter(position_id=1, id__gt=1)[:50]),
+        ("audit page by candidate", page.filter(candidate_id=1, id__gt=1)[:50]),
+        ("audit page by position and candidate",
+         page.filter(position_id=1, candidate_id=1, id__gt=1)[:50]),
+    ]
+
+
+def plan(queryset, connection):
+    """The steps of SQLite's query plan for queryset"""
+    sql, params = queryset.query.get_compiler(connection=connection).as_sql()
+    with connection.cursor() as cursor:
+        cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def unindexed_steps(steps):
+    """The steps that scan voting_votes itself or sort into a temp B-tree"""
+    return [step for step in steps
+            if (step.startswith("SCAN voting_votes") and "INDEX" not in step)
+            or "TEMP B-TREE" in step]
@@ -0,0 +1,155 @@
+"""Read replica for the admin's analytics
+
+Views decorated with reads_from_replica (dashboard, vote audit, exports,
+result PDF) read votes, voters and tallies from the REPLICA_DATABASE
+alias, so those scans stay off the database submit_ballot writes to.
+Everything else, and every write, goes to the primary. Ballot structure,
+election settings, users and sessions are never read from the replica:
+they feed caches shared with the voter-facing pages.
+
+The replica's age is read from its replica_meta table, written by
+refresh() (`python manage.py refresh_replica`), which copies the primary
+SQLite database with the online backup API. A replica older than
+REPLICA_MAX_LAG seconds, missing, or of unknown age is skipped and the
+view reads the primary instead.
+"""
+import os
+import sqlite3
+import time
+from collections import namedtuple
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.http import StreamingHttpResponse
+
+REPLICATED_MODELS = {'voting.votes', 'voting.voter', 'voting.candidatetally'}
+
+ReplicaRead = namedtuple('ReplicaRead', ['alias', 'copied_at'])
+
+# The ReplicaRead of the view being served, None to read the primary
+_current = ContextVar('replica_read', default=None)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        read = _current.get()
+        if read is not None and model._meta.label_lower in REPLICATED_MODELS:
+            return read.alias
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The copy takes its schema from the primary
+        if db == getattr(settings, 'REPLICA_DATABASE', None):
+            return False
+        return None
+
+
+def copied_at(alias):
+    """When the replica's data was taken from the primary, None if unknown"""
+    database = connections[alias].settings_dict
+    if database['ENGINE'].endswith('sqlite3') and not os.path.exists(database['NAME']):
+        return None  # Connecting would create an empty file
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute("SELECT copied_at FROM replica_meta")
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    return row[0] if row else None
+
+
+def choose():
+    """The ReplicaRead to serve an analytics view from, or None"""
+    alias = getattr(settings, 'REPLICA_DATABASE', None)
+    if not alias:
+        return None
+    stamp = copied_at(alias)
+    if stamp is None or time.time() - stamp > settings.REPLICA_MAX_LAG:
+        return None
+    return ReplicaRead(alias, stamp)
+
+
+def current():
+    """The ReplicaRead the current view reads from, None on the primary"""
+    return _current.get()
+
+
+def status():
+    """For the dashboard: where its figures come from and how old they are"""
+    alias = getattr(settings, 'REPLICA_DATABASE', None)
+    if not alias:
+        return None
+    read = current()
+    stamp = read.copied_at if read is not None else copied_at(alias)
+    return {
+        'in_use': read is not None,
+        'copied_at': stamp,
+        'age': None if stamp is None else max(0, int(time.time() - stamp)),
+        'max_lag': settings.REPLICA_MAX_LAG,
+    }
+
+
+def _pinned(read, iterable):
+    iterator = iter(iterable)
+    while True:
+        token = _current.set(read)
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            _current.reset(token)
+        yield chunk
+
+
+def reads_from_replica(view):
+    """Serve the view's reads of REPLICATED_MODELS from the replica. A
+    streamed response is generated after the view returns, so its content
+    is pinned too.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        read = choose()
+        token = _current.set(read)
+        try:
+            response = view(request, *args, **kwargs)
+        finally:
+            _current.reset(token)
+        if read is not None and isinstance(response, StreamingHttpResponse):
+            response.streaming_content = _pinned(read, response.streaming_content)
+        return response
+    return wrapper
+
+
+def refresh(source, target):
+    """Copy the SQLite database at source to target with the online backup
+    API (a consistent snapshot, taken while writers carry on) and record
+    when it was taken. The copy is swapped in with a rename, so readers
+    see either the old copy or the new one. Returns the snapshot time.
+    """
+    partial = str(target) + '.part'
+    if os.path.exists(partial):
+        os.remove(partial)
+    primary = sqlite3.connect(str(source), timeout=30)
+    copy = sqlite3.connect(partial)
+    try:
+        taken = time.time()
+        primary.backup(copy)
+        # Readers of the copy need no WAL file next to it
+        copy.execute("PRAGMA journal_mode=DELETE")
+        copy.execute("CREATE TABLE replica_meta (copied_at REAL NOT NULL)")
+        copy.execute("INSERT INTO replica_meta VALUES (?)", (taken,))
+        copy.commit()
+    finally:
+        copy.close()
+        primary.close()
+    os.replace(partial, str(target))
+    return taken
@@ -0,0 +1,32 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .ballot import bump_ballot_revision_on_commit
+from .election import bump_version_on_commit
+from .models import Position, Candidate, CandidateTally, ElectionSettings
+
+
+@receiver(post_save, sender=Position)
+@receiver(post_delete, sender=Position)
+@receiver(post_save, sender=Candidate)
+@receiver(post_delete, sender=Candidate)
+def ballot_changed(sender, **kwargs):
+    # Any change to what the ballot shows invalidates the cached HTML
+    bump_ballot_revision_on_commit()
+
+
+@receiver(post_save, sender=Candidate)
+def keep_tally_row(sender, instance, created, **kwargs):
+    # Every candidate has a counter row, following it to a new position
+    if created:
+        CandidateTally.objects.get_or_create(
+            candidate=instance, defaults={'position_id': instance.position_id})
+    else:
+        CandidateTally.objects.filter(candidate=instance).exclude(
+            position_id=instance.position_id).update(position_id=instance.position_id)
+
+
+@receiver(post_save, sender=ElectionSettings)
+def election_settings_changed(sender, **kwargs):
+    # Every worker reloads its snapshot at its next check
+    bump_version_on_commit()
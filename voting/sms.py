@@ -0,0 +1,213 @@
+"""Background SMS delivery for OTPs
+
+queue_otp() returns at once. A dispatcher thread in each worker process
+takes queued messages in batches of up to SMS_BATCH_SIZE and hands them to
+the SMS_PROVIDER, which spreads a batch over SMS_WORKERS threads sharing
+one pooled HTTP session. Failed messages are retried with exponential
+backoff (SMS_BACKOFF, doubled per attempt) up to SMS_MAX_ATTEMPTS.
+
+The delivery status is kept per voter in the shared cache, so whichever
+worker serves the voter's polling can answer it.
+"""
+import heapq
+import itertools
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.db.models import F
+from django.utils.module_loading import import_string
+
+from .models import Voter
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+SENT = 'sent'
+FAILED = 'failed'
+STATUS_TIMEOUT = 60 * 30
+STALE_PENDING = 120  # A message pending this long died with its worker
+
+Message = namedtuple('Message', ['voter_id', 'phone', 'text', 'attempt'])
+
+
+class Provider:
+    """Sends SMS messages; subclasses implement send()"""
+
+    def __init__(self):
+        self._executor = None
+
+    def send(self, phone, text):
+        """Return True once the gateway has accepted the message"""
+        raise NotImplementedError
+
+    def send_batch(self, messages):
+        """One result (True if sent) per message, sent concurrently"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=settings.SMS_WORKERS, thread_name_prefix='sms')
+        return list(self._executor.map(self._attempt, messages))
+
+    def _attempt(self, message):
+        try:
+            return self.send(message.phone, message.text)
+        except Exception:
+            logger.exception("SMS to %s failed", message.phone)
+            return False
+
+
+class MultitexterProvider(Provider):
+    """https://www.multitexter.com/developers, credentials from the
+    SMS_EMAIL and SMS_PASSWORD environment variables
+    """
+    URL = "https://app.multitexter.com/v2/app/sms"
+
+    def __init__(self):
+        import requests
+        from requests.adapters import HTTPAdapter
+        super().__init__()
+        self.email = os.environ.get('SMS_EMAIL')
+        self.password = os.environ.get('SMS_PASSWORD')
+        if self.email is None or self.password is None:
+            raise ImproperlyConfigured("SMS_EMAIL/SMS_PASSWORD cannot be Null")
+        # Keep-alive connections, as many as there are sending threads
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(
+            pool_connections=1, pool_maxsize=settings.SMS_WORKERS))
+        self.session.headers.update({'Accept': 'text/plain'})
+
+    def send(self, phone, text):
+        data = {"email": self.email, "password": self.password, "message": text,
+                "sender_name": "OTP", "recipients": phone, "forcednd": 1}
+        response = self.session.post(self.URL, json=data, timeout=settings.SMS_TIMEOUT)
+        return str(response.json().get('status', 0)) == '1'
+
+
+class FakeProvider(Provider):
+    """Keeps messages in self.outbox instead of sending them, for tests and
+    load runs. SMS_FAKE_DELAY (seconds) and SMS_FAKE_FAILURE_RATE (0 to 1)
+    imitate a slow or flaky gateway.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.outbox = []
+        self.lock = threading.Lock()
+
+    def send(self, phone, text):
+        time.sleep(getattr(settings, 'SMS_FAKE_DELAY', 0))
+        if random.random() < getattr(settings, 'SMS_FAKE_FAILURE_RATE', 0):
+            return False
+        with self.lock:
+            self.outbox.append((phone, text))
+        logger.info("SMS to %s: %s", phone, text)
+        return True
+
+
+def _status_key(voter_id):
+    return 'otp_sms:%s' % voter_id
+
+
+def _set_status(voter_id, state):
+    cache.set(_status_key(voter_id), {'state': state, 'at': time.time()},
+              timeout=STATUS_TIMEOUT)
+
+
+def delivery_status(voter_id):
+    """PENDING, SENT, FAILED or None if no OTP was queued lately"""
+    status = cache.get(_status_key(voter_id))
+    if status is None:
+        return None
+    if status['state'] == PENDING and time.time() - status['at'] > STALE_PENDING:
+        return FAILED
+    return status['state']
+
+
+class Dispatcher:
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.retries = []  # Heap of (due, sequence, message)
+        self.sequence = itertools.count()
+        self.provider = None
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def submit(self, message):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self.run, name='sms-dispatcher', daemon=True)
+                self.thread.start()
+        self.queue.put(message)
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            if batch:
+                try:
+                    self.send(batch)
+                finally:
+                    connection.close()
+
+    def next_batch(self):
+        """Block until a message is queued or a retry is due"""
+        timeout = None
+        if self.retries:
+            timeout = max(0, self.retries[0][0] - time.monotonic())
+        batch = []
+        try:
+            batch.append(self.queue.get(timeout=timeout))
+        except queue.Empty:
+            pass
+        while len(batch) < settings.SMS_BATCH_SIZE:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        now = time.monotonic()
+        while self.retries and self.retries[0][0] <= now and \
+                len(batch) < settings.SMS_BATCH_SIZE:
+            batch.append(heapq.heappop(self.retries)[2])
+        return batch
+
+    def send(self, batch):
+        try:
+            if self.provider is None:
+                self.provider = import_string(settings.SMS_PROVIDER)()
+            results = self.provider.send_batch(batch)
+        except Exception:
+            logger.exception("SMS provider unavailable")
+            results = [False] * len(batch)
+        sent = []
+        for message, delivered in zip(batch, results):
+            if delivered:
+                sent.append(message.voter_id)
+                _set_status(message.voter_id, SENT)
+            elif message.attempt + 1 < settings.SMS_MAX_ATTEMPTS:
+                delay = settings.SMS_BACKOFF * 2 ** message.attempt
+                heapq.heappush(self.retries, (
+                    time.monotonic() + delay, next(self.sequence),
+                    message._replace(attempt=message.attempt + 1)))
+            else:
+                _set_status(message.voter_id, FAILED)
+        if sent:
+            # Limited so voters don't exhaust the SMS balance
+            Voter.objects.filter(pk__in=sent).update(otp_sent=F('otp_sent') + 1)
+
+
+dispatcher = Dispatcher()
+
+
+def queue_otp(voter_id, phone, text):
+    """Queue an OTP SMS; its progress is read with delivery_status()"""
+    _set_status(voter_id, PENDING)
+    dispatcher.submit(Message(voter_id, phone, text, 0))
@@ -0,0 +1,88 @@
+"""Ranking of the candidates of every position, in one pass
+
+All candidates of all positions are sorted once on
+(ballot position, -votes, ballot order), which keeps the ordering stable,
+then each position's slice is cut at its max_vote. Candidates level on
+votes at the cut-off form an explicit tie group instead of being picked
+arbitrarily.
+"""
+from collections import Counter, namedtuple
+
+RankedCandidate = namedtuple('RankedCandidate', ['candidate', 'votes', 'rank'])
+PositionResult = namedtuple(
+    'PositionResult', ['position', 'ranking', 'winners', 'tied', 'open_seats'])
+PositionResult.__doc__ = """ranking: every RankedCandidate, best first (ranks 1, 2, 2, 4, ...)
+winners: candidates who certainly hold one of the max_vote seats
+tied: candidates level on votes at the cut-off, competing for open_seats
+"""
+
+
+def count_votes(candidate_ids):
+    """candidate id -> votes from an iterable of one candidate id per vote"""
+    return Counter(candidate_ids)
+
+
+def tabulate(positions, counts):
+    """Rank every position of a ballot snapshot given candidate id -> votes.
+    Returns a PositionResult per position, in ballot order.
+    """
+    rows = [
+        (position_index, -counts.get(candidate.id, 0), order, candidate)
+        for position_index, position in enumerate(positions)
+        for order, candidate in enumerate(position.candidates)
+    ]
+    # (position, votes, order) is unique, so the candidate never gets compared
+    rows.sort()
+    results = []
+    start = 0
+    for position_index, position in enumerate(positions):
+        end = start + len(position.candidates)
+        results.append(_cut(position, rows[start:end]))
+        start = end
+    return results
+
+
+def _cut(position, rows):
+    ranking = []
+    for index, (_, negative_votes, _, candidate) in enumerate(rows):
+        votes = -negative_votes
+        if ranking and ranking[-1].votes == votes:
+            rank = ranking[-1].rank
+        else:
+            rank = index + 1
+        ranking.append(RankedCandidate(candidate, votes, rank))
+    seats = position.max_vote
+    if not ranking or ranking[0].votes == 0:
+        return PositionResult(position, tuple(ranking), (), (), seats)
+    if len(ranking) <= seats:
+        winners = tuple(ranked for ranked in ranking if ranked.votes > 0)
+        return PositionResult(position, tuple(ranking), winners, (), 0)
+    cut_off = ranking[seats - 1].votes
+    if cut_off == 0 or ranking[seats].votes == cut_off:
+        # More candidates share the last seat's votes than seats remain
+        winners = tuple(ranked for ranked in ranking if ranked.votes > cut_off)
+        tied = tuple(ranked for ranked in ranking
+                     if ranked.votes == cut_off and cut_off > 0)
+        return PositionResult(position, tuple(ranking), winners, tied,
+                              seats - len(winners))
+    return PositionResult(position, tuple(ranking), tuple(ranking[:seats]), (), 0)
+
+
+def summarize(result, separator=", "):
+    """One line describing who won a position"""
+    if not result.ranking:
+        return "Position does not have candidates"
+    if not result.winners and not result.tied:
+        return "No one voted for this yet position, yet."
+    if result.position.max_vote == 1:
+        if result.tied:
+            return f"There are {len(result.tied)} candidates with {result.tied[0].votes} votes"
+        return "Winner : " + result.winners[0].candidate.fullname
+    final_list = [ranked.candidate.fullname + " with " + str(ranked.votes) + " votes"
+                  for ranked in result.winners]
+    if result.tied:
+        final_list.append(
+            f"Tie for {result.open_seats} seat(s) between " +
+            " and ".join(ranked.candidate.fullname for ranked in result.tied) +
+            f" with {result.tied[0].votes} votes each")
+    return separator.join(final_list)
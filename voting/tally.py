@@ -0,0 +1,34 @@
+from . import live_tally
+from .ballot import get_snapshot
+from .models import CandidateTally
+from .tabulation import tabulate
+
+
+def vote_counts(live=False):
+    """candidate id -> number of votes, read from the CandidateTally
+    counters (one row per candidate however many Votes rows exist).
+    live=True (the dashboard) reads the shared memory counters instead
+    when LIVE_TALLY_PATH is set; printed results and exports don't.
+    """
+    if live and live_tally.is_enabled():
+        return live_tally.vote_counts()
+    return dict(CandidateTally.objects.values_list('candidate_id', 'count'))
+
+
+def tally_by_position(live=False):
+    """Votes per candidate grouped by position, in ballot order:
+    [(BallotPosition, [(BallotCandidate, votes), ...]), ...]
+    Positions and candidates come from the cached ballot snapshot, so the
+    only work is reading the counters.
+    """
+    counts = vote_counts(live)
+    return [
+        (position, [(candidate, counts.get(candidate.id, 0))
+                    for candidate in position.candidates])
+        for position in get_snapshot().positions
+    ]
+
+
+def current_results(live=False):
+    """tabulation.PositionResult for every position, in ballot order"""
+    return tabulate(get_snapshot().positions, vote_counts(live))
@@ -1,3 +1,526 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.db import OperationalError, connection, connections
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from account.models import CustomUser
+from administrator.pagination import encode_cursor
+from . import journal, live_tally, replica, tally, voter_import
+from . import otp as otp_store
+from .query_plans import hot_queries, plan, unindexed_steps
+from .tabulation import summarize, tabulate
+from .ballot import BallotCandidate, BallotPosition, build_snapshot, record_ballot, results_revision
+from .models import Candidate, CandidateTally, Position, Voter, Votes
+
+# Keep revision stamps and counters out of the node's shared cache and files
+TEST_CACHES = {
+    alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': alias}
+    for alias in ('default', 'sessions', 'otp')
+}
+
+
+def make_voter(number):
+    user = CustomUser.objects.create_user(
+        email='voter%d@example.com' % number, first_name='Voter', last_name=str(number))
+    return Voter.objects.create(admin=user, phone='0800000%04d' % number)
+
+
+@override_settings(CACHES=TEST_CACHES, LIVE_TALLY_PATH=None, VOTE_INGESTION='direct')
+class BallotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.president = Position.objects.create(name='President', max_vote=1, priority=1)
+        cls.senator = Position.objects.create(name='Senator', max_vote=2, priority=2)
+        cls.p1, cls.p2 = [
+            Candidate.objects.create(fullname=name, bio='', photo='candidates/x.jpg',
+                                     position=cls.president)
+            for name in ('P One', 'P Two')]
+        cls.s1, cls.s2, cls.s3 = [
+            Candidate.objects.create(fullname=name, bio='', photo='candidates/x.jpg',
+                                     position=cls.senator)
+            for name in ('S One', 'S Two', 'S Three')]
+        cls.voter = make_voter(1)
+
+    def setUp(self):
+        self.snapshot = build_snapshot()
+
+    def read(self, form):
+        return self.snapshot.read_selections(form)
+
+    def assertTallyMatchesVotes(self):
+        self.assertEqual(CandidateTally.objects.mismatches(), [])
+
+    def test_valid_multi_seat_ballot(self):
+        selections, error = self.read({
+            'president': [str(self.p1.id)],
+            'senator[]': [str(self.s1.id), str(self.s3.id)]})
+        self.assertIsNone(error)
+        self.assertEqual(
+            [(position.id, [candidate.id for candidate in chosen])
+             for position, chosen in selections],
+            [(self.president.id, [self.p1.id]),
+             (self.senator.id, [self.s1.id, self.s3.id])])
+        self.assertTrue(record_ballot(self.voter.id, selections))
+        self.assertEqual(Votes.objects.filter(voter=self.voter).count(), 3)
+        self.voter.refresh_from_db()
+        self.assertTrue(self.voter.voted)
+        self.assertTallyMatchesVotes()
+
+    def test_over_max_vote_is_refused(self):
+        selections, error = self.read({
+            'senator[]': [str(self.s1.id), str(self.s2.id), str(self.s3.id)]})
+        self.assertEqual(selections, [])
+        self.assertIn("only choose 2", error)
+
+    def test_candidate_under_wrong_position_is_refused(self):
+        selections, error = self.read({'president': [str(self.s1.id)]})
+        self.assertEqual(selections, [])
+        self.assertEqual(error, "Please, browse the system properly")
+
+    def test_duplicate_candidate_is_refused(self):
+        selections, error = self.read({'senator[]': [str(self.s2.id), str(self.s2.id)]})
+        self.assertEqual(selections, [])
+        self.assertEqual(error, "Please, browse the system properly")
+
+    def test_second_submit_writes_nothing(self):
+        selections, _ = self.read({'president': [str(self.p2.id)]})
+        self.assertTrue(record_ballot(self.voter.id, selections))
+        selections, _ = self.read({'president': [str(self.p1.id)]})
+        self.assertFalse(record_ballot(self.voter.id, selections))
+        self.assertEqual(list(Votes.objects.values_list('candidate_id', flat=True)),
+                         [self.p2.id])
+        self.assertTallyMatchesVotes()
+
+
+@override_settings(CACHES=TEST_CACHES, LIVE_TALLY_PATH=None, VOTE_INGESTION='direct')
+class TallyTests(TestCase):
+    """CandidateTally stays in step with Votes through the admin's deletes and reset"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.position = Position.objects.create(name='President', max_vote=1, priority=1)
+        cls.first, cls.second = [
+            Candidate.objects.create(fullname=name, bio='', photo='candidates/x.jpg',
+                                     position=cls.position)
+            for name in ('First', 'Second')]
+        cls.admin = CustomUser.objects.create_user(email='admin@example.com', user_type='1')
+
+    def setUp(self):
+        snapshot = build_snapshot()
+        self.voters = [make_voter(number) for number in range(3)]
+        for voter, candidate in zip(self.voters, [self.first, self.first, self.second]):
+            selections, _ = snapshot.read_selections({'president': [str(candidate.id)]})
+            record_ballot(voter.id, selections)
+        self.client.force_login(self.admin)
+
+    def counts(self):
+        return dict(CandidateTally.objects.values_list('candidate_id', 'count'))
+
+    def test_tally_after_submit(self):
+        self.assertEqual(self.counts(), {self.first.id: 2, self.second.id: 1})
+        self.assertEqual(CandidateTally.objects.mismatches(), [])
+
+    def test_tally_after_delete_voter(self):
+        self.client.post(reverse('deleteVoter'), {'id': self.voters[0].id})
+        self.assertFalse(Voter.objects.filter(id=self.voters[0].id).exists())
+        self.assertEqual(self.counts(), {self.first.id: 1, self.second.id: 1})
+        self.assertEqual(CandidateTally.objects.mismatches(), [])
+
+    def test_tally_after_reset(self):
+        revision = results_revision()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('resetVote'))
+        self.assertNotEqual(results_revision(), revision)
+        self.assertEqual(Votes.objects.count(), 0)
+        self.assertEqual(self.counts(), {self.first.id: 0, self.second.id: 0})
+        self.assertFalse(Voter.objects.filter(voted=True).exists())
+        self.assertEqual(CandidateTally.objects.mismatches(), [])
+
+
+
+class TabulationTests(SimpleTestCase):
+    def result(self, seats, *votes):
+        """The PositionResult of one position whose candidates A, B, C, ...
+        got votes[0], votes[1], ... votes
+        """
+        names = "ABCDEFGH"[:len(votes)]
+        candidates = tuple(BallotCandidate(number, name, '', '', 1)
+                           for number, name in enumerate(names, start=1))
+        position = BallotPosition(1, 'Senator', 'senator', seats, 1, candidates)
+        counts = {candidate.id: count for candidate, count in zip(candidates, votes)}
+        [result] = tabulate([position], counts)
+        return result
+
+    def names(self, ranked):
+        return [each.candidate.fullname for each in ranked]
+
+    def test_single_seat_winner(self):
+        result = self.result(1, 2, 7, 1)
+        self.assertEqual(self.names(result.winners), ['B'])
+        self.assertEqual(result.tied, ())
+        self.assertEqual(summarize(result), "Winner : B")
+
+    def test_single_seat_tie(self):
+        result = self.result(1, 4, 1, 4)
+        self.assertEqual(result.winners, ())
+        self.assertEqual(self.names(result.tied), ['A', 'C'])
+        self.assertEqual(result.open_seats, 1)
+        self.assertEqual([each.rank for each in result.ranking], [1, 1, 3])
+        self.assertEqual(summarize(result), "There are 2 candidates with 4 votes")
+
+    def test_tie_straddling_the_cut_off(self):
+        result = self.result(2, 3, 5, 3)
+        self.assertEqual(self.names(result.winners), ['B'])
+        self.assertEqual(self.names(result.tied), ['A', 'C'])
+        self.assertEqual(result.open_seats, 1)
+        self.assertEqual(summarize(result),
+                         "B with 5 votes, Tie for 1 seat(s) between A and C with 3 votes each")
+
+    def test_tie_above_the_cut_off_is_no_tie(self):
+        result = self.result(2, 5, 5, 3)
+        self.assertEqual(self.names(result.winners), ['A', 'B'])
+        self.assertEqual(result.tied, ())
+        self.assertEqual(summarize(result), "A with 5 votes, B with 5 votes")
+
+    def test_all_zero_votes(self):
+        result = self.result(2, 0, 0, 0)
+        self.assertEqual((result.winners, result.tied, result.open_seats), ((), (), 2))
+        self.assertEqual(summarize(result), "No one voted for this yet position, yet.")
+
+    def test_zero_votes_at_the_cut_off(self):
+        result = self.result(2, 0, 3, 0)
+        self.assertEqual(self.names(result.winners), ['B'])
+        self.assertEqual((result.tied, result.open_seats), ((), 1))
+        self.assertEqual(summarize(result), "B with 3 votes")
+
+    def test_fewer_candidates_than_seats(self):
+        result = self.result(3, 0, 2)
+        self.assertEqual(self.names(result.winners), ['B'])
+        self.assertEqual((result.tied, result.open_seats), ((), 0))
+        self.assertEqual(summarize(result), "B with 2 votes")
+
+    def test_no_candidates(self):
+        result = self.result(1)
+        self.assertEqual(summarize(result), "Position does not have candidates")
+
+@override_settings(CACHES=TEST_CACHES, LIVE_TALLY_PATH=None, VOTE_INGESTION='journal')
+class JournalTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.position = Position.objects.create(name='Senator', max_vote=2, priority=1)
+        cls.first, cls.second = [
+            Candidate.objects.create(fullname=name, bio='', photo='candidates/x.jpg',
+                                     position=cls.position)
+            for name in ('First', 'Second')]
+        cls.admin = CustomUser.objects.create_user(email='admin@example.com', user_type='1')
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        journal_settings = override_settings(
+            VOTE_JOURNAL_PATH=os.path.join(directory, 'journal.sqlite3'))
+        journal_settings.enable()
+        self.addCleanup(journal_settings.disable)
+        # No background committer: the test drains the journal itself
+        committer = mock.patch('voting.journal.ensure_committer')
+        committer.start()
+        self.addCleanup(committer.stop)
+        snapshot = build_snapshot()
+        self.selections, _ = snapshot.read_selections(
+            {'senator[]': [str(self.first.id), str(self.second.id)]})
+        self.voters = [make_voter(number) for number in range(3)]
+        for voter in self.voters:
+            journal.append(voter.id, self.selections)
+
+    def test_deleted_voter_does_not_block_the_journal(self):
+        # Deleted behind the journal's back, as if between append and drain
+        self.voters[1].admin.delete()
+        self.assertEqual(journal.drain(), 3)
+        self.assertEqual(journal.pending_count(), 0)
+        self.assertEqual(set(Votes.objects.values_list('voter_id', flat=True)),
+                         {self.voters[0].id, self.voters[2].id})
+        self.assertEqual(CandidateTally.objects.mismatches(), [])
+
+    def test_deleted_candidate_does_not_block_the_journal(self):
+        Candidate.objects.filter(id=self.second.id).delete()
+        self.assertEqual(journal.drain(), 3)
+        self.assertEqual(Votes.objects.filter(candidate_id=self.first.id).count(), 3)
+        self.assertFalse(Voter.objects.filter(voted=False).exists())
+        self.assertEqual(CandidateTally.objects.mismatches(), [])
+
+    def test_deletes_clean_up_the_journal(self):
+        self.client.force_login(self.admin)
+        self.client.post(reverse('deleteVoter'), {'id': self.voters[0].id})
+        self.client.post(reverse('deleteCandidate'), {'id': self.second.id})
+        self.assertFalse(journal.contains(self.voters[0].id))
+        self.assertEqual(journal.pending_count(), 2)
+        self.assertEqual(journal.drain(), 2)
+        self.assertEqual(Votes.objects.count(), 2)
+        self.assertEqual(CandidateTally.objects.mismatches(), [])
+
+
+@override_settings(CACHES=TEST_CACHES, VOTE_INGESTION='direct')
+class LiveTallyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.position = Position.objects.create(name='President', max_vote=1, priority=1)
+        cls.candidate = Candidate.objects.create(
+            fullname='First', bio='', photo='candidates/x.jpg', position=cls.position)
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        tally_settings = override_settings(LIVE_TALLY_PATH=os.path.join(directory, 'tally'))
+        tally_settings.enable()
+        self.addCleanup(tally_settings.disable)
+        self.snapshot = build_snapshot()
+
+    def vote(self, number):
+        selections, _ = self.snapshot.read_selections({'president': [str(self.candidate.id)]})
+        with self.captureOnCommitCallbacks(execute=True):
+            record_ballot(make_voter(number).id, selections)
+
+    def test_ballot_during_rebuild_is_not_lost(self):
+        self.vote(1)
+        self.assertEqual(tally.vote_counts(live=True), {self.candidate.id: 1})
+        count = CandidateTally.objects.counted_from_votes
+        bumps = []
+
+        def counted_then_ballot():
+            # A ballot commits once the rebuild has counted; its on-commit
+            # bump runs in another worker thread
+            counts = count()
+            Votes.objects.create(voter=make_voter(2), position=self.position,
+                                 candidate=self.candidate)
+            bumps.append(threading.Thread(
+                target=live_tally.add_votes, args=([self.candidate.id],)))
+            bumps[0].start()
+            time.sleep(0.1)
+            return counts
+
+        with mock.patch.object(CandidateTally.objects, 'counted_from_votes',
+                               side_effect=counted_then_ballot):
+            live_tally.rebuild()
+        bumps[0].join()
+        self.assertEqual(tally.vote_counts(live=True), {self.candidate.id: 2})
+
+    def test_printed_results_read_candidate_tally(self):
+        self.vote(1)
+        self.vote(2)
+        self.assertEqual(tally.vote_counts(live=True), {self.candidate.id: 2})
+        # Counters gone stale behind the dashboard's back
+        live_tally.add_votes([self.candidate.id])
+        self.assertEqual(tally.vote_counts(live=True), {self.candidate.id: 3})
+        self.assertEqual(tally.vote_counts(), {self.candidate.id: 2})
+        [result] = tally.current_results()
+        self.assertEqual(result.ranking[0].votes, 2)
+
+    def stale_replica(self):
+        """Pin analytics views to a replica copied before any vote was cast"""
+        path = os.path.join(os.path.dirname(settings.LIVE_TALLY_PATH), 'replica.sqlite3')
+        connections.settings['replica'] = dict(connections['default'].settings_dict, NAME=path)
+        self.addCleanup(connections.settings.pop, 'replica')
+        allowed = mock.patch.object(type(self), 'databases', self.databases | {'replica'})
+        allowed.start()
+        self.addCleanup(allowed.stop)
+        self.addCleanup(connections.__delitem__, 'replica')
+        self.addCleanup(connections['replica'].close)
+        with connections['replica'].schema_editor() as editor:
+            for model in (Voter, Votes, CandidateTally):
+                editor.create_model(model)
+        pinned = mock.patch.object(replica, 'choose',
+                                   return_value=replica.ReplicaRead('replica', time.time()))
+        pinned.start()
+        self.addCleanup(pinned.stop)
+
+    def test_pinned_dashboard_counts_from_the_primary(self):
+        self.vote(1)
+        self.vote(2)
+        self.stale_replica()
+        self.client.force_login(CustomUser.objects.create_user(
+            email='admin@example.com', user_type='1'))
+        response = self.client.get(reverse('adminDashboard'))
+        self.assertEqual(response.context['voters_count'], 0)  # Read from the replica
+        self.assertEqual(response.context['chart_data']['President']['votes'], [2])
+        self.assertEqual(tally.vote_counts(live=True), {self.candidate.id: 2})
+
+
+@override_settings(CACHES=TEST_CACHES)
+class VoterImportJobTests(TestCase):
+    def test_unexpected_error_fails_the_job(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as upload:
+            upload.write(",".join(voter_import.COLUMNS) + "\n")
+        with mock.patch('voting.voter_import.import_voters',
+                        side_effect=OperationalError("database is locked")), \
+                mock.patch('voting.voter_import.connection'):
+            voter_import._run_job('job', upload.name)
+        status = voter_import.job_status('job')
+        self.assertEqual(status['state'], 'failed')
+        self.assertEqual(status['message'], "OperationalError: database is locked")
+        self.assertFalse(os.path.exists(upload.name))
+
+
+class OtpTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        # The configured OTP cache, in a scratch directory
+        caches = dict(TEST_CACHES, otp=dict(settings.CACHES[settings.OTP_CACHE],
+                                            LOCATION=directory))
+        cache_settings = override_settings(CACHES=caches)
+        cache_settings.enable()
+        self.addCleanup(cache_settings.disable)
+
+    def test_codes_outlive_a_large_electorate(self):
+        codes = {voter_id: otp_store.issue(voter_id) for voter_id in range(400)}
+        self.assertTrue(all(otp_store.verify(voter_id, code)
+                            for voter_id, code in codes.items()))
+
+    def test_reset_voids_codes(self):
+        code = otp_store.issue(1)
+        otp_store.reset()
+        self.assertFalse(otp_store.verify(1, code))
+        self.assertTrue(otp_store.verify(1, otp_store.issue(1)))
+
+    def test_wrong_guesses_use_up_the_code(self):
+        code = otp_store.issue(1)
+        wrong = '0' * settings.OTP_LENGTH  # Codes never contain 0
+        for _ in range(settings.OTP_MAX_ATTEMPTS):
+            self.assertFalse(otp_store.verify(1, wrong))
+        self.assertFalse(otp_store.verify(1, code))
+
+
+class QueryPlanTests(TestCase):
+    def test_hot_votes_queries_use_indexes(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest("EXPLAIN QUERY PLAN is SQLite's")
+        for label, queryset in hot_queries():
+            with self.subTest(label):
+                steps = plan(queryset, connection)
+                self.assertEqual(unindexed_steps(steps), [], steps)
+
+
+class AdminPageTests(TestCase):
+    """Walks the admin's keyset-paginated JSON endpoints"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_user(email='admin@example.com', user_type='1')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def walk(self, url_name, **params):
+        """(every row, in order, following 'next' to the end; pages fetched)"""
+        rows, pages = [], 0
+        while True:
+            response = self.client.get(reverse(url_name), params)
+            self.assertEqual(response.status_code, 200)
+            page = response.json()
+            rows += page['rows']
+            pages += 1
+            if page['next'] is None:
+                return rows, pages
+            params['cursor'] = page['next']
+
+
+@override_settings(CACHES=TEST_CACHES, LIVE_TALLY_PATH=None)
+class VoteAuditPageTests(AdminPageTests):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        position = Position.objects.create(name='President', max_vote=1, priority=1)
+        # Many votes share a candidate: sorting by candidate is full of ties
+        cls.candidates = [
+            Candidate.objects.create(fullname=name, bio='', photo='candidates/x.jpg',
+                                     position=position)
+            for name in ('Beta', 'Alpha')]
+        for number in range(7):
+            Votes.objects.create(voter=make_voter(number), position=position,
+                                 candidate=cls.candidates[number % 2])
+
+    def expected(self, descending=False):
+        votes = Votes.objects.order_by('candidate__fullname', 'id')
+        ids = list(votes.values_list('id', flat=True))
+        return ids[::-1] if descending else ids
+
+    def test_pages_by_id(self):
+        rows, pages = self.walk('viewVotesData', limit=3)
+        self.assertEqual([row['id'] for row in rows],
+                         list(Votes.objects.order_by('id').values_list('id', flat=True)))
+        self.assertEqual(pages, 3)
+
+    def test_ties_on_the_sort_field(self):
+        rows, _ = self.walk('viewVotesData', sort='candidate', limit=2)
+        self.assertEqual([row['id'] for row in rows], self.expected())
+
+    def test_descending_ties(self):
+        rows, _ = self.walk('viewVotesData', sort='-candidate', limit=2)
+        self.assertEqual([row['id'] for row in rows], self.expected(descending=True))
+
+    def test_filtered_pages(self):
+        alpha = self.candidates[1]
+        rows, _ = self.walk('viewVotesData', candidate=alpha.id, limit=2)
+        self.assertEqual([row['candidate'] for row in rows], ['Alpha'] * 3)
+
+    def test_malformed_cursor_is_refused(self):
+        for cursor in ('not a cursor', encode_cursor('x', 1)[:-4], 'WyJ4Il0='):
+            with self.subTest(cursor):
+                response = self.client.get(reverse('viewVotesData'), {'cursor': cursor})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'error': "Invalid cursor"})
+
+    def test_unknown_sort_is_refused(self):
+        response = self.client.get(reverse('viewVotesData'), {'sort': 'phone'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class VoterDirectoryTests(AdminPageTests):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        people = [('Ada', 'Lovelace', 'ada@example.com', '08011110000'),
+                  ('Alan', 'Turing', 'alan@example.org', '08022220000'),
+                  ('Grace', 'Hopper', 'grace@example.com', '08011119999'),
+                  ('Edsger', 'Dijkstra', 'edsger@example.net', '09033330000')]
+        for first_name, last_name, email, phone in people:
+            user = CustomUser.objects.create_user(
+                email=email, first_name=first_name, last_name=last_name)
+            Voter.objects.create(admin=user, phone=phone)
+
+    def search(self, query):
+        rows, _ = self.walk('viewVotersData', q=query, limit=2)
+        return [row['email'] for row in rows]
+
+    def test_email_prefix(self):
+        self.assertEqual(self.search('ALAN@'), ['alan@example.org'])
+        self.assertEqual(self.search('alan@example.com'), [])
+        self.assertEqual(self.search('grace@example.c'), ['grace@example.com'])
+
+    def test_phone_prefix(self):
+        self.assertEqual(self.search('080111'), ['ada@example.com', 'grace@example.com'])
+        self.assertEqual(self.search('0903'), ['edsger@example.net'])
+        self.assertEqual(self.search('0804'), [])
+
+    def test_name_prefix(self):
+        self.assertEqual(self.search('a'), ['ada@example.com', 'alan@example.org'])
+        self.assertEqual(self.search('tur'), ['alan@example.org'])
+        self.assertEqual(self.search(' HOP '), ['grace@example.com'])
+        self.assertEqual(self.search('urin'), [])
+
+    def test_empty_query_lists_everyone(self):
+        self.assertEqual(len(self.search('')), 4)
+
+    def test_descending_pages(self):
+        rows, pages = self.walk('viewVotersData', sort='-id', limit=3)
+        self.assertEqual([row['id'] for row in rows],
+                         list(Voter.objects.order_by('-id').values_list('id', flat=True)))
+        self.assertEqual(pages, 2)
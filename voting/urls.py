@@ -8,6 +8,7 @@ urlpatterns = [
     path('verify/', views.verify, name='voterVerify'),
     path('verify/otp', views.verify_otp, name='verify_otp'),
     path('otp/resend/', views.resend_otp, name='resend_otp'),
+    path('otp/status/', views.otp_status, name='otp_status'),
     path('ballot/vote', views.show_ballot, name='show_ballot'),
     path('ballot/vote/preview', views.preview_vote, name='preview_vote'),
     path('ballot/vote/submit', views.submit_ballot, name='submit_ballot'),
@@ -1,13 +1,12 @@
 from django.shortcuts import render, redirect, reverse
 from account.views import account_login
-from .models import Position, Candidate, Voter, Votes
+from .models import Voter, Votes
+from .ballot import get_ballot, get_snapshot, record_ballot
+from . import journal, election, sms
+from . import otp as otp_store
 from django.http import JsonResponse
-from django.utils.text import slugify
 from django.contrib import messages
-from django.conf import settings
 from django.http import JsonResponse
-import requests
-import json
 # Create your views here.
 
 
@@ -19,68 +18,7 @@ def index(request):
 
 
 def generate_ballot(display_controls=False):
-    positions = Position.objects.order_by('priority').all()
-    output = ""
-    candidates_data = ""
-    num = 1
-    # return None
-    for position in positions:
-        name = position.name
-        position_name = slugify(name)
-        candidates = Candidate.objects.filter(position=position)
-        for candidate in candidates:
-            if position.max_vote > 1:
-                instruction = "You may select up to " + \
-                    str(position.max_vote) + " candidates"
-                input_box = '<input type="checkbox" value="'+str(candidate.id)+'" class="flat-red ' + \
-                    position_name+'" name="' + \
-                    position_name+"[]" + '">'
-            else:
-                instruction = "Select only one candidate"
-                input_box = '<input value="'+str(candidate.id)+'" type="radio" class="flat-red ' + \
-                    position_name+'" name="'+position_name+'">'
-            image = "/media/" + str(candidate.photo)
-            candidates_data = candidates_data + '<li>' + input_box + '<button type="button" class="btn btn-primary btn-sm btn-flat clist platform" data-fullname="'+candidate.fullname+'" data-bio="'+candidate.bio+'"><i class="fa fa-search"></i> Platform</button><img src="' + \
-                image+'" height="100px" width="100px" class="clist"><span class="cname clist">' + \
-                candidate.fullname+'</span></li>'
-        up = ''
-        if position.priority == 1:
-            up = 'disabled'
-        down = ''
-        if position.priority == positions.count():
-            down = 'disabled'
-        output = output + f"""<div class="row">	<div class="col-xs-12"><div class="box box-solid" id="{position.id}">
-             <div class="box-header with-border">
-            <h3 class="box-title"><b>{name}</b></h3>"""
-
-        if display_controls:
-            output = output + f""" <div class="pull-right box-tools">
-        <button type="button" class="btn btn-default btn-sm moveup" data-id="{position.id}" {up}><i class="fa fa-arrow-up"></i> </button>
-        <button type="button" class="btn btn-default btn-sm movedown" data-id="{position.id}" {down}><i class="fa fa-arrow-down"></i></button>
-        </div>"""
-
-        output = output + f"""</div>
-        <div class="box-body">
-        <p>{instruction}
-        <span class="pull-right">
-        <button type="button" class="btn btn-success btn-sm btn-flat reset" data-desc="{position_name}"><i class="fa fa-refresh"></i> Reset</button>
-        </span>
-        </p>
-        <div id="candidate_list">
-        <ul>
-        {candidates_data}
-        </ul>
-        </div>
-        </div>
-        </div>
-        </div>
-        </div>
-        """
-        position.priority = num
-        position.save()
-        num = num + 1
-        candidates_data = ''
-    return output
+    return get_ballot(display_controls=display_controls)
 
 
 def fetch_ballot(request):
@@ -88,30 +26,19 @@ def fetch_ballot(request):
     return JsonResponse(output, safe=False)
 
 
-def generate_otp():
-    """Link to this function
-    https://www.codespeedy.com/otp-generation-using-random-module-in-python/
-    """
-    import random as r
-    otp = ""
-    for i in range(r.randint(5, 8)):
-        otp += str(r.randint(1, 9))
-    return otp
-
-
 def dashboard(request):
     user = request.user
     # * Check if this voter has been verified
-    if user.voter.otp is None or user.voter.verified == False:
-        if not settings.SEND_OTP:
+    if not user.voter.verified:
+        if not election.current().sends_otp:
             # Bypass
-            msg = bypass_otp()
+            msg = bypass_otp(user.voter)
             messages.success(request, msg)
             return redirect(reverse('show_ballot'))
         else:
             return redirect(reverse('voterVerify'))
     else:
-        if user.voter.voted:  # * User has voted
+        if journal.has_voted(user.voter):  # * User has voted
             # To display election result or candidates I voted for ?
             context = {
                 'my_votes': Votes.objects.filter(voter=user.voter),
@@ -132,81 +59,53 @@ def resend_otp(request):
     """API For SMS
     I used https://www.multitexter.com/ API to send SMS
     You might not want to use this or this service might not be available in your Country
-    For quick and easy access, Toggle the SEND_OTP from True to False in settings.py
+    For quick and easy access, set the OTP mode to "No OTP" in the admin's Configure dialog
     """
     user = request.user
     voter = user.voter
     error = False
-    if settings.SEND_OTP:
+    pending = False
+    if election.current().sends_otp:
         if voter.otp_sent >= 3:
             error = True
             response = "You have requested OTP three times. You cannot do this again! Please enter previously sent OTP"
+        elif sms.delivery_status(voter.id) == sms.PENDING:
+            pending = True
+            response = "Your OTP is on its way"
         else:
             phone = voter.phone
-            # Now, check if an OTP has been generated previously for this voter
-            otp = voter.otp
-            if otp is None:
-                # Generate new OTP
-                otp = generate_otp()
-                voter.otp = otp
-                voter.save()
-            try:
-                msg = "Dear " + str(user) + ", kindly use " + \
-                    str(otp) + " as your OTP"
-                message_is_sent = send_sms(phone, msg)
-                if message_is_sent:  # * OTP was sent successfully
-                    # Update how many OTP has been sent to this voter
-                    # Limited to Three so voters don't exhaust OTP balance
-                    voter.otp_sent = voter.otp_sent + 1
-                    voter.save()
-
-                    response = "OTP has been sent to your phone number. Please provide it in the box provided below"
-                else:
-                    error = True
-                    response = "OTP not sent. Please try again"
-            except Exception as e:
-                response = "OTP could not be sent." + str(e)
-
-                # * Send OTP
+            # The code sent previously, unless it has expired
+            otp = otp_store.issue(voter.id)
+            msg = "Dear " + str(user) + ", kindly use " + \
+                str(otp) + " as your OTP"
+            sms.queue_otp(voter.id, phone, msg)
+            pending = True
+            response = "Your OTP is being sent to your phone number. Please provide it in the box provided below"
+    else:
+        # Bypass OTP verification for this voter only
+        response = bypass_otp(voter)
+    return JsonResponse({"data": response, "error": error, "pending": pending})
+
+
+def otp_status(request):
+    """Polled by the verify page while an OTP SMS is pending"""
+    status = sms.delivery_status(request.user.voter.id)
+    if status == sms.SENT:
+        response = "OTP has been sent to your phone number. Please provide it in the box provided below"
+    elif status == sms.FAILED:
+        response = "OTP not sent. Please try again"
     else:
-        #! Update all Voters record and set OTP to 0000
-        #! Bypass OTP verification by updating verified to 1
-        #! Redirect voters to ballot page
-        response = bypass_otp()
-    return JsonResponse({"data": response, "error": error})
+        response = "Your OTP is on its way"
+    return JsonResponse({"status": status, "data": response, "error": status == sms.FAILED})
 
 
-def bypass_otp():
-    Voter.objects.all().filter(otp=None, verified=False).update(otp="0000", verified=True)
+def bypass_otp(voter):
+    Voter.objects.filter(pk=voter.id).update(verified=True)
+    voter.verified = True
     response = "Kindly cast your vote"
     return response
 
 
-def send_sms(phone_number, msg):
-    """Read More
-    https://www.multitexter.com/developers
-    """
-    import requests
-    import os
-    import json
-    response = ""
-    email = os.environ.get('SMS_EMAIL')
-    password = os.environ.get('SMS_PASSWORD')
-    if email is None or password is None:
-        raise Exception("Email/Password cannot be Null")
-    url = "https://app.multitexter.com/v2/app/sms"
-    data = {"email": email, "password": password, "message": msg,
-            "sender_name": "OTP", "recipients": phone_number, "forcednd": 1}
-    headers = {'Content-type': 'application/json', 'Accept': 'text/plain'}
-    r = requests.post(url, data=json.dumps(data), headers=headers)
-    response = r.json()
-    status = response.get('status', 0)
-    if str(status) == '1':
-        return True
-    else:
-        return False
-
-
 def verify_otp(request):
     error = True
     if request.method != 'POST':
@@ -216,16 +115,14 @@ def verify_otp(request):
         if otp is None:
             messages.error(request, "Please provide valid OTP")
         else:
-            # Get User OTP
             voter = request.user.voter
-            db_otp = voter.otp
-            if db_otp != otp:
+            if not otp_store.verify(voter.id, otp.strip()):
                 messages.error(request, "Provided OTP is not valid")
             else:
                 messages.success(
                     request, "You are now verified. Please cast your vote")
                 voter.verified = True
-                voter.save()
+                voter.save(update_fields=['verified'])
                 error = False
     if error:
         return redirect(reverse('voterVerify'))
@@ -233,86 +130,60 @@ def verify_otp(request):
 
 
 def show_ballot(request):
-    if request.user.voter.voted:
+    if journal.has_voted(request.user.voter):
         messages.error(request, "You have voted already")
         return redirect(reverse('voterDashboard'))
-    ballot = generate_ballot(display_controls=False)
+    closed = election.current().closed_message()
     context = {
-        'ballot': ballot
+        'closed': closed,
+        'ballot': None if closed else generate_ballot(display_controls=False)
     }
     return render(request, "voting/voter/ballot.html", context)
 
 
 def preview_vote(request):
+    output = ""
+    closed = election.current().closed_message()
     if request.method != 'POST':
         error = True
         response = "Please browse the system properly"
+    elif closed:
+        error = True
+        response = closed
     else:
-        output = ""
         form = dict(request.POST)
         # We don't need to loop over CSRF token
         form.pop('csrfmiddlewaretoken', None)
-        error = False
-        data = []
-        positions = Position.objects.all()
-        for position in positions:
-            max_vote = position.max_vote
-            pos = slugify(position.name)
-            pos_id = position.id
+        selections, response = get_snapshot().read_selections(form)
+        error = response is not None
+        for position, candidates in selections:
             if position.max_vote > 1:
-                this_key = pos + "[]"
-                form_position = form.get(this_key)
-                if form_position is None:
-                    continue
-                if len(form_position) > max_vote:
-                    error = True
-                    response = "You can only choose " + \
-                        str(max_vote) + " candidates for " + position.name
-                else:
-                    # for key, value in form.items():
-                    start_tag = f"""
-                       <div class='row votelist' style='padding-bottom: 2px'>
+                start_tag = f"""
+                   <div class='row votelist' style='padding-bottom: 2px'>
 		                      	<span class='col-sm-4'><span class='pull-right'><b>{position.name} :</b></span></span>
 		                      	<span class='col-sm-8'>
-                                <ul style='list-style-type:none; margin-left:-40px'>
-                                
-                    
-                    """
-                    end_tag = "</ul></span></div><hr/>"
-                    data = ""
-                    for form_candidate_id in form_position:
-                        try:
-                            candidate = Candidate.objects.get(
-                                id=form_candidate_id, position=position)
-                            data += f"""
+                            <ul style='list-style-type:none; margin-left:-40px'>
+                """
+                end_tag = "</ul></span></div><hr/>"
+                data = ""
+                for candidate in candidates:
+                    data += f"""
 		                      	<li><i class="fa fa-check-square-o"></i> {candidate.fullname}</li>
-                            """
-                        except:
-                            error = True
-                            response = "Please, browse the system properly"
-                    output += start_tag + data + end_tag
+                    """
+                output += start_tag + data + end_tag
             else:
-                this_key = pos
-                form_position = form.get(this_key)
-                if form_position is None:
-                    continue
                 # Max Vote == 1
-                try:
-                    form_position = form_position[0]
-                    candidate = Candidate.objects.get(
-                        position=position, id=form_position)
-                    output += f"""
-                            <div class='row votelist' style='padding-bottom: 2px'>
+                candidate = candidates[0]
+                output += f"""
+                        <div class='row votelist' style='padding-bottom: 2px'>
 		                      	<span class='col-sm-4'><span class='pull-right'><b>{position.name} :</b></span></span>
 		                      	<span class='col-sm-8'><i class="fa fa-check-circle-o"></i> {candidate.fullname}</span>
 		                    </div>
-                      <hr/>
-                    """
-                except Exception as e:
-                    error = True
-                    response = "Please, browse the system properly"
+                  <hr/>
+                """
     context = {
         'error': error,
+        'message': response if error else "",
         'list': output
     }
     return JsonResponse(context, safe=False)
@@ -323,9 +194,14 @@ def submit_ballot(request):
         messages.error(request, "Please, browse the system properly")
         return redirect(reverse('show_ballot'))
 
+    closed = election.current().closed_message()
+    if closed:
+        messages.error(request, closed)
+        return redirect(reverse('show_ballot'))
+
     # Verify if the voter has voted or not
     voter = request.user.voter
-    if voter.voted:
+    if journal.has_voted(voter):
         messages.error(request, "You have voted already")
         return redirect(reverse('voterDashboard'))
 
@@ -337,67 +213,20 @@ def submit_ballot(request):
     if len(form.keys()) < 1:
         messages.error(request, "Please select at least one candidate")
         return redirect(reverse('show_ballot'))
-    positions = Position.objects.all()
-    form_count = 0
-    for position in positions:
-        max_vote = position.max_vote
-        pos = slugify(position.name)
-        pos_id = position.id
-        if position.max_vote > 1:
-            this_key = pos + "[]"
-            form_position = form.get(this_key)
-            if form_position is None:
-                continue
-            if len(form_position) > max_vote:
-                messages.error(request, "You can only choose " +
-                               str(max_vote) + " candidates for " + position.name)
-                return redirect(reverse('show_ballot'))
-            else:
-                for form_candidate_id in form_position:
-                    form_count += 1
-                    try:
-                        candidate = Candidate.objects.get(
-                            id=form_candidate_id, position=position)
-                        vote = Votes()
-                        vote.candidate = candidate
-                        vote.voter = voter
-                        vote.position = position
-                        vote.save()
-                    except Exception as e:
-                        messages.error(
-                            request, "Please, browse the system properly " + str(e))
-                        return redirect(reverse('show_ballot'))
-        else:
-            this_key = pos
-            form_position = form.get(this_key)
-            if form_position is None:
-                continue
-            # Max Vote == 1
-            form_count += 1
-            try:
-                form_position = form_position[0]
-                candidate = Candidate.objects.get(
-                    position=position, id=form_position)
-                vote = Votes()
-                vote.candidate = candidate
-                vote.voter = voter
-                vote.position = position
-                vote.save()
-            except Exception as e:
-                messages.error(
-                    request, "Please, browse the system properly " + str(e))
-                return redirect(reverse('show_ballot'))
-    # Count total number of records inserted
-    # Check it viz-a-viz form_count
-    inserted_votes = Votes.objects.filter(voter=voter)
-    if (inserted_votes.count() != form_count):
-        # Delete
-        inserted_votes.delete()
-        messages.error(request, "Please try voting again!")
+    selections, error = get_snapshot().read_selections(form)
+    if error is not None:
+        messages.error(request, error)
         return redirect(reverse('show_ballot'))
+    if len(selections) < 1:
+        messages.error(request, "Please select at least one candidate")
+        return redirect(reverse('show_ballot'))
+    if journal.is_enabled():
+        # Receipt once the ballot is fsynced to the journal
+        accepted = journal.append(voter.id, selections)
     else:
-        # Update Voter profile to voted
-        voter.voted = True
-        voter.save()
-        messages.success(request, "Thanks for voting")
+        accepted = record_ballot(voter.id, selections)
+    if not accepted:
+        messages.error(request, "You have voted already")
         return redirect(reverse('voterDashboard'))
+    messages.success(request, "Thanks for voting")
+    return redirect(reverse('voterDashboard'))
@@ -0,0 +1,202 @@
+"""Bulk voter import from CSV
+
+Columns: first_name, last_name, email, phone, password (header row
+required). Rows are validated in one streaming pass, a chunk at a time.
+Passwords of a valid chunk are hashed in a process pool (make_password is
+the expensive part) and the CustomUser + Voter pairs are inserted with
+bulk_create in one transaction per chunk. Invalid rows are skipped and
+reported with their line number.
+
+Uploads from the admin run as a background job (start_job) whose progress
+is kept in the shared cache, so the request returns at once.
+"""
+import csv
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from uuid import uuid4
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from account.models import CustomUser
+from .models import Voter
+
+logger = logging.getLogger(__name__)
+
+COLUMNS = ['first_name', 'last_name', 'email', 'phone', 'password']
+CHUNK_SIZE = 500
+JOB_TIMEOUT = 60 * 60 * 24
+REPORTED_ERRORS = 200  # Errors kept in a job's status
+
+
+class ImportReport:
+    def __init__(self):
+        self.created = 0
+        self.errors = []  # (line number, message)
+
+    def as_dict(self):
+        return {'created': self.created, 'errors': self.errors}
+
+
+def _init_worker():
+    django.setup()
+
+
+def read_rows(lines):
+    """Yield (line number, row dict) from an iterable of CSV text lines"""
+    reader = csv.DictReader(lines)
+    missing = [column for column in COLUMNS if column not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError("Missing column(s): " + ", ".join(missing))
+    for row in reader:
+        yield reader.line_num, {column: (row.get(column) or '').strip() for column in COLUMNS}
+
+
+def validate_row(row, seen_emails, seen_phones):
+    """Returns an error message, or None for a row that can be imported"""
+    for column in COLUMNS:
+        if not row[column]:
+            return column + " is required"
+    row['email'] = row['email'].lower()
+    try:
+        validate_email(row['email'])
+    except ValidationError:
+        return "Invalid email " + row['email']
+    if not row['phone'].isdigit() or len(row['phone']) > 11:
+        return "Phone must be at most 11 digits, nothing else"
+    if len(row['first_name']) > 150 or len(row['last_name']) > 150:
+        return "Name is too long"
+    if row['email'] in seen_emails:
+        return "Duplicate email " + row['email']
+    if row['phone'] in seen_phones:
+        return "Duplicate phone " + row['phone']
+    return None
+
+
+def import_voters(lines, processes=None, progress=None):
+    """Import voters from CSV lines; returns an ImportReport.
+    progress, if given, is called with the report after every chunk.
+    """
+    report = ImportReport()
+    seen_emails = set()
+    seen_phones = set()
+    with ProcessPoolExecutor(max_workers=processes or os.cpu_count(),
+                             initializer=_init_worker) as pool:
+        chunk = []
+        for line, row in read_rows(lines):
+            error = validate_row(row, seen_emails, seen_phones)
+            if error:
+                report.errors.append((line, error))
+                continue
+            seen_emails.add(row['email'])
+            seen_phones.add(row['phone'])
+            chunk.append((line, row))
+            if len(chunk) >= CHUNK_SIZE:
+                _insert_chunk(chunk, pool, report)
+                chunk = []
+                if progress:
+                    progress(report)
+        if chunk:
+            _insert_chunk(chunk, pool, report)
+    if progress:
+        progress(report)
+    return report
+
+
+def _insert_chunk(chunk, pool, report):
+    emails = [row['email'] for _, row in chunk]
+    phones = [row['phone'] for _, row in chunk]
+    taken_emails = set(CustomUser.objects.filter(
+        email__in=emails).values_list('email', flat=True))
+    taken_phones = set(Voter.objects.filter(
+        phone__in=phones).values_list('phone', flat=True))
+    rows = []
+    for line, row in chunk:
+        if row['email'] in taken_emails:
+            report.errors.append((line, "The given email is already registered"))
+        elif row['phone'] in taken_phones:
+            report.errors.append((line, "The given phone is already registered"))
+        else:
+            rows.append(row)
+    if not rows:
+        return
+    processes = getattr(pool, '_max_workers', 1)
+    hashes = list(pool.map(make_password, [row['password'] for row in rows],
+                           chunksize=max(1, len(rows) // (processes * 4))))
+    with transaction.atomic():
+        users = CustomUser.objects.bulk_create([
+            CustomUser(email=row['email'], password=password,
+                       first_name=row['first_name'], last_name=row['last_name'])
+            for row, password in zip(rows, hashes)
+        ])
+        Voter.objects.bulk_create([
+            Voter(admin_id=user.id, phone=row['phone'])
+            for user, row in zip(users, rows)
+        ])
+    report.created += len(rows)
+
+
+def _job_key(job_id):
+    return 'voter_import:' + job_id
+
+
+def job_status(job_id):
+    """{'state': 'running'|'done'|'failed', 'created', 'errors', ...} or None"""
+    return cache.get(_job_key(job_id))
+
+
+def _set_status(job_id, state, report, **extra):
+    status = {
+        'state': state,
+        'created': report.created,
+        'error_count': len(report.errors),
+        'errors': report.errors[:REPORTED_ERRORS],
+    }
+    status.update(extra)
+    cache.set(_job_key(job_id), status, timeout=JOB_TIMEOUT)
+
+
+def start_job(uploaded_file):
+    """Spool an uploaded CSV to disk and import it in a background thread.
+    Returns the job id to poll job_status() with.
+    """
+    job_id = uuid4().hex
+    with tempfile.NamedTemporaryFile(suffix='.csv', delete=False) as spool:
+        for part in uploaded_file.chunks():
+            spool.write(part)
+    _set_status(job_id, 'running', ImportReport())
+    threading.Thread(target=_run_job, args=(job_id, spool.name),
+                     daemon=True).start()
+    return job_id
+
+
+def _run_job(job_id, path):
+    report = ImportReport()
+
+    def progress(current):
+        nonlocal report
+        report = current  # What was committed so far, should a chunk fail
+        _set_status(job_id, 'running', current)
+
+    try:
+        with open(path, newline='', encoding='utf-8-sig') as lines:
+            report = import_voters(lines, progress=progress)
+        _set_status(job_id, 'done', report)
+    except (ValueError, UnicodeDecodeError, csv.Error) as error:
+        _set_status(job_id, 'failed', report, message=str(error))
+    except Exception as error:
+        # Anything else (a locked database, a broken hashing pool) must
+        # still end the job, or the voters page polls it forever
+        logger.exception("Voter import %s failed", job_id)
+        _set_status(job_id, 'failed', report,
+                    message="%s: %s" % (type(error).__name__, error))
+    finally:
+        os.remove(path)
+        connection.close()
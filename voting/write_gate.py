@@ -0,0 +1,48 @@
+"""Queue SQLite writers instead of letting them spin on the database lock
+
+SQLite allows one writer at a time and makes the others retry after
+growing sleeps (busy_timeout). Writers that take write_gate() first wait
+their turn in the kernel instead: a thread lock within the process, then
+flock() on '<database>.write-gate' across the workers of the node, so the
+next writer starts the moment the previous one commits. Enter it before
+the transaction starts, never inside one.
+"""
+import fcntl
+import os
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+_lock = threading.Lock()
+_files = {}  # gate path -> fd, kept open for the life of the process
+
+
+def _gate_fd(connection):
+    path = str(connection.settings_dict['NAME']) + '.write-gate'
+    fd = _files.get(path)
+    if fd is None:
+        fd = _files[path] = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    return fd
+
+
+def is_enabled(connection):
+    return (getattr(settings, 'SQLITE_WRITE_GATE', False)
+            and connection.vendor == 'sqlite'
+            and not connection.is_in_memory_db())
+
+
+@contextmanager
+def write_gate(using='default'):
+    connection = connections[using]
+    if not is_enabled(connection):
+        yield
+        return
+    with _lock:
+        fd = _gate_fd(connection)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)